@@ -0,0 +1,5 @@
+"""Benchmarks for Pomice's hot paths.
+
+Each module can be run on its own, i.e: `python -m benchmarks.codec`
+The full suite, which runs against fake Lavalink nodes, is `python -m benchmarks.run`
+"""
@@ -0,0 +1,71 @@
+"""Measures the CPU time spent encoding and decoding node traffic
+with the standard library's json module versus the default orjson codec.
+"""
+import argparse
+import json
+import time
+
+from pomice.codec import JSONCodec, OrjsonCodec
+
+PLAYER_UPDATE = (
+    '{"op":"playerUpdate","guildId":"899324069235810315",'
+    '"state":{"time":1637278211043,"position":76400,"connected":true,"ping":32}}'
+)
+
+VOLUME_OP = {"op": "volume", "guildId": "899324069235810315", "volume": 80}
+
+
+def _measure(func, frames: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        func(frames)
+        best = min(best, time.process_time() - start)
+
+    return best
+
+
+def run(frames: int = 10_000, repeat: int = 5) -> dict:
+    codecs = {"json": JSONCodec(), "orjson": OrjsonCodec()}
+    results = {}
+
+    for name, codec in codecs.items():
+        def decode(count: int, loads=codec.loads):
+            for _ in range(count):
+                loads(PLAYER_UPDATE)
+
+        def encode(count: int, dumps=codec.dumps):
+            for _ in range(count):
+                dumps(VOLUME_OP)
+
+        results[name] = {
+            "decode_ms": _measure(decode, frames, repeat) * 1000,
+            "encode_ms": _measure(encode, frames, repeat) * 1000,
+        }
+
+    # The old code decoded with msg.json() and encoded with json.dumps() before
+    # handing a str to send_str(), which encodes it to bytes once more.
+    def legacy_encode(count: int):
+        for _ in range(count):
+            json.dumps(VOLUME_OP).encode()
+
+    results["json"]["encode_ms"] = _measure(legacy_encode, frames, repeat) * 1000
+    results["saved_ms"] = {
+        "decode": results["json"]["decode_ms"] - results["orjson"]["decode_ms"],
+        "encode": results["json"]["encode_ms"] - results["orjson"]["encode_ms"],
+    }
+    results["frames"] = frames
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.frames, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
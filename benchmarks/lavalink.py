@@ -0,0 +1,540 @@
+"""A fake Lavalink node for load testing Pomice without real nodes.
+
+It speaks enough of the Lavalink v3 websocket and REST APIs for a Pomice node to connect,
+search, build tracks and play them. Playback is simulated on a clock which can run faster than
+real time, so `playerUpdate`, `stats` and track events arrive as they would from a real node.
+
+Latency, frame loss, disconnects and rate limiting can be injected to measure how Pomice
+behaves under failure. All randomness comes from a seeded generator, so runs are reproducible.
+
+It can also be run on its own, i.e: `python -m benchmarks.lavalink --port 2333`
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import orjson
+from aiohttp import WSMsgType, web
+
+from pomice.decoder import decode_track, encode_track
+from pomice.exceptions import TrackLoadError
+
+__all__ = [
+    "FakeLavalink",
+    "FakePlayer",
+]
+
+VERSION = "3.7.0"
+
+
+def make_track(query: str, index: int = 0, *, length: int = 180_000) -> dict:
+    """Returns a track in the format of Lavalink's REST API, made up from a query.
+       The same query and index always make the same track.
+    """
+    digest = hashlib.blake2b(f"{query}:{index}".encode(), digest_size=8).hexdigest()
+    identifier = digest[:11]
+    info = {
+        "title": f"{query} ({index})",
+        "author": "Pomice",
+        "length": length,
+        "identifier": identifier,
+        "isStream": False,
+        "isSeekable": True,
+        "uri": f"https://www.youtube.com/watch?v={identifier}",
+        "position": 0,
+        "sourceName": "youtube",
+    }
+    return {"track": encode_track(info), "info": info}
+
+
+class FakePlayer:
+    """The state the fake node keeps for each guild."""
+
+    def __init__(self, guild_id: str) -> None:
+        self.guild_id = guild_id
+        self.track: Optional[str] = None
+        self.length: int = 0
+        self.end_time: Optional[int] = None
+        self.position: float = 0
+        self.paused: bool = False
+        self.volume: int = 100
+        self.filters: dict = {}
+        self.connected: bool = False
+
+    def __repr__(self) -> str:
+        return f"<FakePlayer guild_id={self.guild_id} track={self.track is not None}>"
+
+
+class _Session:
+    __slots__ = (
+        "websocket", "players", "resume_key", "resume_timeout", "expire_task", "outbox", "sender"
+    )
+
+    def __init__(self, websocket: web.WebSocketResponse) -> None:
+        self.websocket = websocket
+        self.players: Dict[str, FakePlayer] = {}
+        self.resume_key: Optional[str] = None
+        self.resume_timeout: int = 60
+        self.expire_task: Optional[asyncio.Task] = None
+        # Delayed frames waiting to be sent, as (due time, payload)
+        self.outbox: Deque[Tuple[float, bytes]] = deque()
+        self.sender: Optional[asyncio.Task] = None
+
+
+class FakeLavalink:
+    """A fake Lavalink node, served with aiohttp.
+
+       `speed` is how fast the playback clock runs compared to real time, i.e: at a speed of 60,
+       a three minute track ends after three seconds. `player_update_interval` and `stats_interval`
+       are in real seconds.
+
+       The fault injection attributes can be changed while the node is running:
+       - `latency` and `jitter` delay every REST response and outbound frame, in seconds.
+         Delayed frames are sent in the background and in order, so the clock and reading ops
+         never wait on them.
+       - `loss` is the chance of dropping an outbound frame.
+       - `rate_limit` is the chance of a REST request getting a 429 with `retry_after` seconds.
+       - `disconnect()` closes every websocket, like a node restarting.
+
+       Every op and REST request received is counted in `ops` and `requests`.
+    """
+
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        password: str = "youshallnotpass",
+        speed: float = 1.0,
+        player_update_interval: float = 5.0,
+        stats_interval: float = 60.0,
+        search_results: int = 5,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        rate_limit: float = 0.0,
+        retry_after: float = 0.1,
+        seed: Optional[int] = 0
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.speed = speed
+        self.player_update_interval = player_update_interval
+        self.stats_interval = stats_interval
+        self.search_results = search_results
+
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+
+        self.ops: Counter = Counter()
+        self.requests: Counter = Counter()
+        self.frames_sent: int = 0
+        self.frames_dropped: int = 0
+
+        self._random = random.Random(seed)
+        self._tracks: Dict[str, dict] = {}
+        self._sessions: List[_Session] = []
+        self._resumable: Dict[str, _Session] = {}
+
+        self._runner: Optional[web.AppRunner] = None
+        self._clock_task: Optional[asyncio.Task] = None
+        self._stats_task: Optional[asyncio.Task] = None
+        self._started_at = time.monotonic()
+
+        self._app = web.Application()
+        self._app.router.add_get("/", self._handle_websocket)
+        self._app.router.add_get("/version", self._handle_version)
+        self._app.router.add_get("/loadtracks", self._handle_load_tracks)
+        self._app.router.add_get("/decodetrack", self._handle_decode_track)
+        self._app.router.add_post("/decodetracks", self._handle_decode_tracks)
+
+    def __repr__(self) -> str:
+        return f"<FakeLavalink port={self.port} players={len(self.players)}>"
+
+    async def __aenter__(self) -> "FakeLavalink":
+        return await self.start()
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    @property
+    def players(self) -> Dict[str, FakePlayer]:
+        """Returns the players of every connected session, keyed by guild ID."""
+        return {
+            guild_id: player
+            for session in self._sessions
+            for guild_id, player in session.players.items()
+        }
+
+    async def start(self) -> "FakeLavalink":
+        """Starts serving. If the port is 0, a free one is picked and stored in `port`."""
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+        loop = asyncio.get_running_loop()
+        self._clock_task = loop.create_task(self._run_clock())
+        self._stats_task = loop.create_task(self._run_stats())
+        return self
+
+    async def stop(self) -> None:
+        """Closes every connection and stops serving."""
+        for task in (self._clock_task, self._stats_task):
+            if task:
+                task.cancel()
+
+        await self.disconnect(resumable=False)
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def disconnect(self, *, resumable: bool = True) -> None:
+        """Closes every websocket connection. If `resumable` is True,
+           sessions which configured resuming can be resumed as they would with a real node.
+        """
+        for session in list(self._sessions):
+            if not resumable:
+                session.resume_key = None
+            await session.websocket.close()
+
+    def add_tracks(self, query: str, tracks: List[dict]) -> None:
+        """Sets the tracks returned when `query` is loaded,
+           in the format returned by `make_track()`.
+           An empty list makes the query return no matches.
+        """
+        self._tracks[query] = tracks
+
+    def _latency(self) -> float:
+        return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+
+    async def _delay(self) -> None:
+        if (delay := self._latency()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, session: _Session, data: dict) -> None:
+        if self.loss and self._random.random() < self.loss:
+            self.frames_dropped += 1
+            return
+
+        payload = orjson.dumps(data)
+        delay = self._latency()
+        idle = not session.outbox and (session.sender is None or session.sender.done())
+        if delay <= 0 and idle:
+            await self._write(session, payload)
+            return
+
+        session.outbox.append((time.monotonic() + delay, payload))
+        if idle:
+            session.sender = asyncio.get_running_loop().create_task(self._send_delayed(session))
+
+    async def _send_delayed(self, session: _Session) -> None:
+        # Like on a real connection, a frame is never sent before the ones queued ahead of it
+        while session.outbox:
+            due, payload = session.outbox[0]
+            if (remaining := due - time.monotonic()) > 0:
+                await asyncio.sleep(remaining)
+
+            session.outbox.popleft()
+            await self._write(session, payload)
+
+    async def _write(self, session: _Session, payload: bytes) -> None:
+        if session.websocket.closed:
+            return
+
+        await session.websocket.send_bytes(payload)
+        self.frames_sent += 1
+
+    async def _send_event(self, session: _Session, player: FakePlayer, event: str, **data) -> None:
+        await self._send(
+            session, {"op": "event", "type": event, "guildId": player.guild_id, **data}
+        )
+
+    def _authorized(self, request: web.Request) -> bool:
+        return request.headers.get("Authorization") == self.password
+
+    async def _rest_response(self, request: web.Request, data) -> web.Response:
+        self.requests[request.path] += 1
+        await self._delay()
+
+        if not self._authorized(request):
+            return web.Response(status=401)
+
+        if self.rate_limit and self._random.random() < self.rate_limit:
+            return web.Response(status=429, headers={"Retry-After": str(self.retry_after)})
+
+        if data is None:
+            return web.Response(status=400)
+
+        return web.Response(body=orjson.dumps(data), content_type="application/json")
+
+    async def _handle_version(self, request: web.Request) -> web.Response:
+        # /version returns plain text, not JSON
+        self.requests[request.path] += 1
+        if not self._authorized(request):
+            return web.Response(status=401)
+
+        return web.Response(text=VERSION)
+
+    async def _handle_load_tracks(self, request: web.Request) -> web.Response:
+        query = request.query.get("identifier", "")
+        tracks = self._tracks.get(query)
+
+        if tracks is None:
+            if query.startswith(("ytsearch:", "ytmsearch:", "scsearch:")):
+                tracks = [make_track(query, index) for index in range(self.search_results)]
+            else:
+                tracks = [make_track(query)]
+
+        if not tracks:
+            load_type = "NO_MATCHES"
+        elif query.startswith(("ytsearch:", "ytmsearch:", "scsearch:")):
+            load_type = "SEARCH_RESULT"
+        else:
+            load_type = "TRACK_LOADED"
+
+        data = {
+            "loadType": load_type,
+            "playlistInfo": {},
+            "tracks": tracks,
+            "exception": None,
+        }
+        return await self._rest_response(request, data)
+
+    async def _handle_decode_track(self, request: web.Request) -> web.Response:
+        try:
+            data = decode_track(request.query.get("track", ""))
+        except TrackLoadError:
+            data = None
+
+        return await self._rest_response(request, data)
+
+    async def _handle_decode_tracks(self, request: web.Request) -> web.Response:
+        try:
+            data = [
+                {"track": identifier, "info": decode_track(identifier)}
+                for identifier in orjson.loads(await request.read())
+            ]
+        except (TrackLoadError, orjson.JSONDecodeError, TypeError):
+            data = None
+
+        return await self._rest_response(request, data)
+
+    async def _handle_websocket(self, request: web.Request) -> web.StreamResponse:
+        if not self._authorized(request) or "User-Id" not in request.headers:
+            return web.Response(status=401)
+
+        session = self._resumable.pop(request.headers.get("Resume-Key"), None)
+        resumed = session is not None
+        if resumed:
+            session.expire_task.cancel()
+
+        websocket = web.WebSocketResponse()
+        websocket.headers["Session-Resumed"] = "true" if resumed else "false"
+        await websocket.prepare(request)
+
+        if resumed:
+            session.websocket = websocket
+        else:
+            session = _Session(websocket)
+
+        self._sessions.append(session)
+        try:
+            async for msg in websocket:
+                if msg.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    await self._handle_op(session, orjson.loads(msg.data))
+        finally:
+            self._sessions.remove(session)
+            if session.sender and not session.resume_key:
+                session.sender.cancel()
+                session.outbox.clear()
+
+            if session.resume_key:
+                self._resumable[session.resume_key] = session
+                session.expire_task = asyncio.get_running_loop().create_task(
+                    self._expire_session(session)
+                )
+
+        return websocket
+
+    async def _expire_session(self, session: _Session) -> None:
+        await asyncio.sleep(session.resume_timeout)
+        self._resumable.pop(session.resume_key, None)
+
+    async def _handle_op(self, session: _Session, data: dict) -> None:
+        op = data.get("op")
+        self.ops[op] += 1
+
+        if op == "configureResuming":
+            session.resume_key = data.get("key")
+            session.resume_timeout = data.get("timeout", 60)
+            return
+
+        guild_id = data.get("guildId")
+        if not guild_id:
+            return
+
+        if op == "destroy":
+            session.players.pop(guild_id, None)
+            return
+
+        player = session.players.get(guild_id)
+        if player is None:
+            player = session.players[guild_id] = FakePlayer(guild_id)
+
+        if op == "voiceUpdate":
+            player.connected = True
+
+        elif op == "play":
+            if player.track and data.get("noReplace"):
+                return
+
+            try:
+                info = decode_track(data["track"])
+            except TrackLoadError:
+                await self._send_event(
+                    session, player, "TrackExceptionEvent", track=data["track"],
+                    exception={"message": "Invalid track", "severity": "COMMON", "cause": ""}
+                )
+                return
+
+            if player.track:
+                await self._send_event(
+                    session, player, "TrackEndEvent", track=player.track, reason="REPLACED"
+                )
+
+            player.track = data["track"]
+            player.length = info["length"]
+            player.position = int(data.get("startTime", 0))
+            player.end_time = int(data["endTime"]) if "endTime" in data else None
+            player.paused = data.get("pause", False)
+            await self._send_event(session, player, "TrackStartEvent", track=player.track)
+
+        elif op == "stop":
+            if player.track:
+                track, player.track = player.track, None
+                await self._send_event(
+                    session, player, "TrackEndEvent", track=track, reason="STOPPED"
+                )
+
+        elif op == "pause":
+            player.paused = data.get("pause", False)
+        elif op == "seek":
+            player.position = int(data.get("position", 0))
+        elif op == "volume":
+            player.volume = data.get("volume", 100)
+        elif op == "filters":
+            player.filters = {
+                key: value for key, value in data.items() if key not in ("op", "guildId")
+            }
+
+    async def _run_clock(self) -> None:
+        # Playback advances once per tick, so track ends are at most one tick late
+        tick = min(self.player_update_interval, 0.05)
+        last_update = time.monotonic()
+
+        while True:
+            await asyncio.sleep(tick)
+            elapsed = tick * 1000 * self.speed
+            send_updates = time.monotonic() - last_update >= self.player_update_interval
+            if send_updates:
+                last_update = time.monotonic()
+
+            for session in list(self._sessions):
+                for player in list(session.players.values()):
+                    await self._advance(session, player, elapsed)
+
+                    if send_updates and player.track:
+                        await self._send(session, {
+                            "op": "playerUpdate",
+                            "guildId": player.guild_id,
+                            "state": {
+                                "time": int(time.time() * 1000),
+                                "position": int(player.position),
+                                "connected": player.connected,
+                                "ping": 0
+                            }
+                        })
+
+    async def _advance(self, session: _Session, player: FakePlayer, elapsed: float) -> None:
+        if not player.track or player.paused:
+            return
+
+        player.position += elapsed
+        end = player.end_time or player.length
+        if player.position >= end:
+            track, player.track = player.track, None
+            player.position = 0
+            await self._send_event(session, player, "TrackEndEvent", track=track, reason="FINISHED")
+
+    async def _run_stats(self) -> None:
+        while True:
+            for session in list(self._sessions):
+                players = len(session.players)
+                playing = sum(1 for player in session.players.values() if player.track)
+                data = {
+                    "op": "stats",
+                    "players": players,
+                    "playingPlayers": playing,
+                    "uptime": int((time.monotonic() - self._started_at) * 1000),
+                    "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+                    "cpu": {"cores": 1, "systemLoad": 0.0, "lavalinkLoad": 0.0},
+                }
+                # Like Lavalink, frame stats are left out while nothing is playing
+                if playing:
+                    data["frameStats"] = {"sent": 3000 * playing, "nulled": 0, "deficit": 0}
+
+                await self._send(session, data)
+
+            await asyncio.sleep(self.stats_interval)
+
+
+async def _serve(args) -> None:
+    node = FakeLavalink(
+        host=args.host,
+        port=args.port,
+        password=args.password,
+        speed=args.speed,
+        latency=args.latency,
+        loss=args.loss,
+        rate_limit=args.rate_limit,
+        seed=args.seed
+    )
+    await node.start()
+    print(f"Fake Lavalink listening on {node.host}:{node.port}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await node.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2333)
+    parser.add_argument("--password", default="youshallnotpass")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
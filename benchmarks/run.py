@@ -0,0 +1,418 @@
+"""Runs Pomice's end-to-end benchmarks against fake Lavalink nodes and prints the results as JSON.
+
+Pass `--output` to save the results, and `--compare` with a saved file to fail (exit code 1)
+when any result regressed by more than `--threshold` (25% by default) compared to it, i.e:
+```
+python -m benchmarks.run --output baseline.json
+python -m benchmarks.run --compare baseline.json --threshold 0.3
+```
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+import pomice
+from pomice import NodePool, Player, Queue, Track, TrackCache
+
+from . import codec
+from .lavalink import FakeLavalink, make_track
+
+PASSWORD = "youshallnotpass"
+
+# How many times the queue and codec timings are repeated. The best run is kept,
+# as slower ones were only slowed down by the rest of the machine.
+REPEAT = 15
+
+
+def _result(value: float, unit: str, *, higher_is_better: bool) -> dict:
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percentile), len(ordered) - 1)]
+
+
+class _Bot:
+    """Just enough of a discord.py client for nodes and players."""
+
+    def __init__(self) -> None:
+        self.user = SimpleNamespace(id=1)
+        self.loop = asyncio.get_running_loop()
+        self._connection = SimpleNamespace(_remove_voice_client=lambda key: None)
+
+    async def wait_until_ready(self) -> None:
+        pass
+
+    def dispatch(self, event: str, *args) -> None:
+        pass
+
+    def add_listener(self, func, name: str) -> None:
+        pass
+
+
+class _Guild:
+    def __init__(self, guild_id: int) -> None:
+        self.id = guild_id
+
+    async def change_voice_state(self, **kwargs) -> None:
+        pass
+
+
+class _Channel:
+    def __init__(self, guild: _Guild) -> None:
+        self.guild = guild
+        self.id = guild.id
+
+    def _get_voice_client_key(self):
+        return self.guild.id, "guild_id"
+
+
+def _make_tracks(count: int) -> List[Track]:
+    return [
+        Track(track_id=data["track"], info=data["info"])
+        for data in (make_track("benchmark", index) for index in range(count))
+    ]
+
+
+async def _connect_node(bot: _Bot, fake: FakeLavalink, identifier: str) -> pomice.Node:
+    return await NodePool.create_node(
+        bot=bot,
+        host=fake.host,
+        port=fake.port,
+        password=PASSWORD,
+        identifier=identifier
+    )
+
+
+async def _connect_players(bot: _Bot, node: pomice.Node, count: int) -> List[Player]:
+    players = []
+    for guild_id in range(1, count + 1):
+        player = Player(bot, _Channel(_Guild(guild_id)), node=node)
+        await player.connect(timeout=0, reconnect=False)
+        players.append(player)
+
+    return players
+
+
+async def bench_send(players: int) -> Dict[str, dict]:
+    """Ops per second through Node.send,
+       for a play followed by a burst of volume changes per player.
+    """
+    async with FakeLavalink() as fake:
+        bot = _Bot()
+        node = await _connect_node(bot, fake, "send")
+        connected = await _connect_players(bot, node, players)
+        track = _make_tracks(1)[0]
+        sent_before = node._outbound.sent
+
+        start = time.perf_counter()
+        for player in connected:
+            await player.play(track)
+            for volume in (50, 60, 70, 80):
+                await player.set_volume(volume)
+
+        calls = players * 5
+        await node._outbound.flush()
+        elapsed = time.perf_counter() - start
+        frames = node._outbound.sent - sent_before
+
+        await node.disconnect()
+
+    return {
+        "send.ops_per_sec": _result(calls / elapsed, "ops/s", higher_is_better=True),
+        "send.frames_per_sec": _result(frames / elapsed, "frames/s", higher_is_better=True),
+    }
+
+
+async def bench_inbound(players: int, frames: int) -> Dict[str, dict]:
+    """Inbound frames per second through Node._handle_payload, directly and through the pipeline."""
+    async with FakeLavalink() as fake:
+        bot = _Bot()
+        node = await _connect_node(bot, fake, "inbound")
+        await _connect_players(bot, node, players)
+
+        payloads = []
+        for index in range(frames):
+            guild_id = str(index % players + 1)
+            if index % 10:
+                payloads.append({
+                    "op": "playerUpdate",
+                    "guildId": guild_id,
+                    "state": {"time": index, "position": index, "connected": True, "ping": 0}
+                })
+            else:
+                payloads.append({"op": "event", "type": "TrackStuckEvent", "guildId": guild_id,
+                                 "track": "", "thresholdMs": 1000})
+
+        handle = node._handle_payload
+        start = time.perf_counter()
+        for data in payloads:
+            await handle(data)
+        direct = time.perf_counter() - start
+
+        pipeline = node._pipeline
+        processed = pipeline.processed
+        start = time.perf_counter()
+        for data in payloads:
+            await pipeline.put(data)
+        while pipeline.processed - processed < frames:
+            await asyncio.sleep(0)
+        piped = time.perf_counter() - start
+
+        await node.disconnect()
+
+    return {
+        "inbound.handle_payload_per_sec": _result(
+            frames / direct, "frames/s", higher_is_better=True
+        ),
+        "inbound.pipeline_per_sec": _result(frames / piped, "frames/s", higher_is_better=True),
+    }
+
+
+async def bench_get_tracks(
+    searches: int,
+    queries: int,
+    concurrency: int,
+    latency: float
+) -> Dict[str, dict]:
+    """get_tracks latency for a skewed mix of repeated searches,
+       with and without the track cache.
+    """
+    results = {}
+    rng = random.Random(0)
+    # A few popular queries make up most searches, like in a real bot
+    workload = [
+        f"song {int(rng.paretovariate(1.2)) % queries}" for _ in range(searches)
+    ]
+
+    for name, cache in (("uncached", None), ("cached", TrackCache())):
+        async with FakeLavalink(latency=latency) as fake:
+            NodePool.set_track_cache(cache)
+            node = await _connect_node(_Bot(), fake, f"tracks-{name}")
+            semaphore = asyncio.Semaphore(concurrency)
+            samples = []
+
+            async def search(query: str):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await node.get_tracks(query)
+                    samples.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(search(query) for query in workload))
+            await node.disconnect()
+
+        results[f"get_tracks.{name}.p50_ms"] = _result(
+            _percentile(samples, 0.5) * 1000, "ms", higher_is_better=False
+        )
+        results[f"get_tracks.{name}.p99_ms"] = _result(
+            _percentile(samples, 0.99) * 1000, "ms", higher_is_better=False
+        )
+
+    NodePool.set_track_cache(None)
+    return results
+
+
+def _time_per_op(func: Callable[[], None], count: int) -> float:
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        return (time.perf_counter() - start) / count * 1_000_000
+    finally:
+        gc.enable()
+
+
+def bench_queue(sizes: List[int]) -> Dict[str, dict]:
+    """Cost of common Queue operations, in microseconds per operation.
+       Every operation is timed once per round, and the best round is kept.
+    """
+    costs: Dict[str, float] = {}
+    tracks = _make_tracks(max(sizes))
+    extra = _make_tracks(1)[0]
+    # Queue.shuffle uses the global generator, so every run shuffles the same way
+    random.seed(0)
+
+    # Rounds go through every operation, so a slow spell on the machine
+    # only affects some rounds of each operation rather than every round of one
+    for _ in range(REPEAT):
+        for size in sizes:
+            queue = Queue()
+
+            def fill():
+                nonlocal queue
+                queue = Queue()
+                for track in tracks[:size]:
+                    queue.put(track)
+
+            operations = {
+                "put": lambda: _time_per_op(fill, 1) / size,
+                "get": lambda: _time_per_op(lambda: queue.put(queue.get()), 2000),
+                "put_at_front": lambda: _time_per_op(
+                    lambda: (queue.put_at_front(extra), queue.get()), 2000
+                ),
+                "find_position": lambda: _time_per_op(
+                    lambda: queue.find_position(tracks[size - 1]), 5
+                ),
+                "remove": lambda: _time_per_op(
+                    lambda: (queue.remove(tracks[size // 2]), queue.put(tracks[size // 2])), 5
+                ),
+                "shuffle": lambda: _time_per_op(queue.shuffle, 2),
+                "copy": lambda: _time_per_op(queue.copy, 5),
+            }
+
+            for operation, measure in operations.items():
+                name = f"queue.{size}.{operation}_us"
+                costs[name] = min(costs.get(name, float("inf")), measure())
+
+    return {
+        name: _result(cost, "us/op", higher_is_better=False) for name, cost in costs.items()
+    }
+
+
+def _measure_memory(create: Callable[[], list]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = create()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return (after - before) // len(objects)
+
+
+async def bench_memory(players: int, tracks: int) -> Dict[str, dict]:
+    """Memory held by each connected Player and each queued Track, in bytes."""
+    track_data = [make_track("memory", index) for index in range(tracks)]
+
+    def create_tracks():
+        queue = Queue()
+        for data in track_data:
+            queue.put(Track(track_id=data["track"], info=dict(data["info"])))
+        return queue.get_queue()
+
+    per_track = _measure_memory(create_tracks)
+
+    async with FakeLavalink() as fake:
+        bot = _Bot()
+        node = await _connect_node(bot, fake, "memory")
+        channels = [_Channel(_Guild(guild_id)) for guild_id in range(1, players + 1)]
+
+        def create_players():
+            created = [Player(bot, channel, node=node) for channel in channels]
+            for player in created:
+                node._players[player.guild.id] = player
+            return created
+
+        per_player = _measure_memory(create_players)
+        node._players.clear()
+        await node.disconnect()
+
+    return {
+        "memory.per_track_bytes": _result(per_track, "bytes", higher_is_better=False),
+        "memory.per_player_bytes": _result(per_player, "bytes", higher_is_better=False),
+    }
+
+
+def bench_codec(frames: int) -> Dict[str, dict]:
+    """Time spent encoding and decoding node traffic with the default codec."""
+    data = codec.run(frames, repeat=REPEAT)["orjson"]
+    return {
+        "codec.decode_ms": _result(data["decode_ms"], "ms", higher_is_better=False),
+        "codec.encode_ms": _result(data["encode_ms"], "ms", higher_is_better=False),
+    }
+
+
+async def run(args) -> dict:
+    results = {}
+    results.update(await bench_send(args.players))
+    results.update(await bench_inbound(args.players, args.frames))
+    results.update(
+        await bench_get_tracks(args.searches, args.queries, args.concurrency, args.latency)
+    )
+    results.update(bench_queue(args.queue_sizes))
+    results.update(await bench_memory(args.players, args.tracks))
+    results.update(bench_codec(args.frames))
+    await NodePool.close()
+
+    return {
+        "meta": {
+            "pomice": pomice.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "players": args.players,
+            "created_at": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Returns a description of every result which regressed by more than `threshold`,
+       i.e: 0.1 for 10%. Results missing from either side are skipped.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        if (previous := baseline["results"].get(name)) is None or not previous["value"]:
+            continue
+
+        change = (result["value"] - previous["value"]) / previous["value"]
+        if result["higher_is_better"]:
+            change = -change
+
+        if change > threshold:
+            regressions.append(
+                f"{name}: {previous['value']:.4g} -> {result['value']:.4g} {result['unit']} "
+                f"({change:+.1%} worse)"
+            )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--frames", type=int, default=100_000)
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="Simulated REST latency of the fake nodes, in seconds")
+    parser.add_argument("--queue-sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--tracks", type=int, default=10_000)
+    parser.add_argument("--output", help="Saves the results to this file")
+    parser.add_argument("--compare", help="Compares the results to the ones saved in this file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="How much worse a result can be before it's a regression, "
+                             "which has to be above how much results vary between runs")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        if regressions := compare(baseline, results, args.threshold):
+            print("Regressions found:", *regressions, sep="\n  ", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
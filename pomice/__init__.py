@@ -22,11 +22,17 @@ __version__ = "1.1.7b"
 __title__ = "pomice"
 __author__ = "cloudwithax"
 
+from .cache import *
+from .codec import *
+from .decoder import *
 from .enums import SearchType
 from .events import *
 from .exceptions import *
 from .filters import *
 from .objects import *
+from .pipeline import *
 from .player import Player
+from .prefetch import *
 from .pool import *
 from .queue import *
+from .recorder import *
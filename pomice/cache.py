@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from .objects import Track
+
+__all__ = [
+    "ResolutionCache",
+    "TrackCache",
+]
+
+log = logging.getLogger(__name__)
+
+SEARCH_QUERY_REGEX = re.compile(r"^(?P<type>(?:ytm?|sc)search):(?P<query>.+)$", re.DOTALL)
+
+DEFAULT_TTLS = {
+    "TRACK_LOADED": 3600,
+    "PLAYLIST_LOADED": 3600,
+    "SEARCH_RESULT": 1800,
+    "NO_MATCHES": 300,
+    "LOAD_FAILED": 0,
+}
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a track query so equivalent searches share a cache key.
+       Search queries are case and whitespace insensitive, while URLs are only stripped
+       since their paths and IDs are case sensitive.
+    """
+    query = query.strip()
+
+    if match := SEARCH_QUERY_REGEX.match(query):
+        terms = " ".join(match.group("query").split()).lower()
+        return f"{match.group('type')}:{terms}"
+
+    return query
+
+
+class _CacheEntry:
+    __slots__ = ("data", "expires_at", "stale_until")
+
+    def __init__(self, data: dict, expires_at: float, stale_until: float) -> None:
+        self.data = data
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class TrackCache:
+    """An LRU cache with time based expiry for the raw results of a node's `/loadtracks` endpoint.
+       The cache is shared across all nodes in the pool, and is keyed by the normalized query,
+       which already includes the search type used.
+
+       Each load type can have its own TTL using the `ttls` argument, i.e: `{"NO_MATCHES": 60}`.
+       Load types with a TTL of 0 are never cached.
+
+       If `stale_while_revalidate` is set, expired entries are still returned for up to
+       `stale_ttl` seconds while they are refreshed in the background.
+       If `serve_stale_on_error` is set, expired entries are returned if refreshing them fails.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = 1024,
+        ttls: Optional[Dict[str, float]] = None,
+        stale_ttl: float = 600,
+        stale_while_revalidate: bool = False,
+        serve_stale_on_error: bool = False
+    ) -> None:
+        self._max_size = max_size
+        self._ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._stale_ttl = stale_ttl
+        self._stale_while_revalidate = stale_while_revalidate
+        self._serve_stale_on_error = serve_stale_on_error
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.TrackCache size={len(self)} max_size={self._max_size} "
+            f"hits={self.hits} misses={self.misses} stale_hits={self.stale_hits}>"
+        )
+
+    @property
+    def hit_ratio(self) -> float:
+        """Returns the ratio of lookups that were served from the cache."""
+        total = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / total if total else 0.0
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the fresh cached result for a key, or None if there isn't one.
+           Results returned count as hits. Misses aren't counted, as the caller
+           is expected to go through `fetch()` next.
+        """
+        entry = self._entries.get(key)
+        if not entry or time.monotonic() >= entry.expires_at:
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry.data
+
+    def set(self, key: str, data: dict) -> None:
+        """Stores a result in the cache, using the TTL of its load type."""
+        ttl = self._ttls.get(data.get("loadType"), 0)
+        if ttl <= 0:
+            return
+
+        now = time.monotonic()
+        self._entries[key] = _CacheEntry(data, now + ttl, now + ttl + self._stale_ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        """Removes a key from the cache."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        self._entries.clear()
+
+    async def _refresh(self, key: str, loader: Callable[[], Awaitable[dict]]) -> None:
+        try:
+            self.set(key, await loader())
+        except Exception:
+            # The stale entry is still usable, so a failed refresh is not fatal
+            pass
+        finally:
+            self._refreshing.discard(key)
+
+    async def fetch(self, key: str, loader: Callable[[], Awaitable[dict]]) -> dict:
+        """Returns the cached result for a key, calling the loader on a miss."""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry:
+            if now < entry.expires_at:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.data
+
+            if self._stale_while_revalidate and now < entry.stale_until:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    asyncio.get_running_loop().create_task(self._refresh(key, loader))
+                return entry.data
+
+        self.misses += 1
+
+        try:
+            data = await loader()
+        except Exception:
+            if self._serve_stale_on_error and entry and now < entry.stale_until:
+                self.stale_hits += 1
+                return entry.data
+            raise
+
+        self.set(key, data)
+        return data
+
+
+class ResolutionCache:
+    """A persistent cache of which Lavalink track each Spotify track resolved to,
+       stored in an SQLite database with an in-memory LRU cache in front of it.
+       Set it with `NodePool.set_resolution_cache()` so players check it before searching.
+
+       Tracks are keyed by their ISRC, or their Spotify ID if they don't have one,
+       along with the search type used. Tracks that couldn't be resolved are also cached,
+       for `negative_ttl` seconds, so they aren't searched for over and over.
+
+       Database access runs in a background thread, so it never blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str = "pomice_resolutions.db",
+        *,
+        max_size: int = 4096,
+        ttl: float = 30 * 24 * 3600,
+        negative_ttl: float = 24 * 3600
+    ) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+
+        # A single thread keeps every query on one connection, in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pomice-resolutions")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.ResolutionCache path={self._path!r} hits={self.hits} "
+            f"negative_hits={self.negative_hits} misses={self.misses}>"
+        )
+
+    @staticmethod
+    def key_for(track: "Track") -> Optional[str]:
+        """Returns the key a Spotify track is cached under, or None if it can't be cached."""
+        if track.isrc:
+            return f"{track._search_type}:isrc:{track.isrc}"
+        if track.identifier:
+            return f"{track._search_type}:spotify:{track.identifier}"
+
+        return None
+
+    async def _run(self, func: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self._path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions "
+                "(key TEXT PRIMARY KEY, track TEXT, expires_at REAL NOT NULL)"
+            )
+            connection.execute("DELETE FROM resolutions WHERE expires_at <= ?", (time.time(),))
+            connection.commit()
+            self._connection = connection
+
+        return self._connection
+
+    def _select(self, key: str) -> Optional[Tuple[Optional[str], float]]:
+        return self._connect().execute(
+            "SELECT track, expires_at FROM resolutions WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+
+    def _upsert(self, key: str, track_id: Optional[str], expires_at: float) -> None:
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO resolutions (key, track, expires_at) VALUES (?, ?, ?)",
+            (key, track_id, expires_at)
+        )
+        connection.commit()
+
+    def _delete(self, key: Optional[str]) -> None:
+        connection = self._connect()
+        if key is None:
+            connection.execute("DELETE FROM resolutions")
+        else:
+            connection.execute("DELETE FROM resolutions WHERE key = ?", (key,))
+        connection.commit()
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _remember(self, key: str, track_id: Optional[str], expires_at: float) -> None:
+        self._entries[key] = (track_id, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """Looks up a key. Returns whether it was found, and the Lavalink track identifier
+           it resolved to, which is None if the track couldn't be resolved.
+        """
+        entry = self._entries.get(key)
+        if entry and entry[1] <= time.time():
+            del self._entries[key]
+            entry = None
+
+        if entry is None:
+            try:
+                entry = await self._run(self._select, key)
+            except sqlite3.Error:
+                log.exception("Failed to read from the resolution cache")
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self._remember(key, *entry)
+        else:
+            self._entries.move_to_end(key)
+
+        track_id = entry[0]
+        if track_id is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+
+        return True, track_id
+
+    async def set(self, key: str, track_id: Optional[str]) -> None:
+        """Stores the Lavalink track identifier a key resolved to.
+           Pass in None to remember that it couldn't be resolved.
+        """
+        expires_at = time.time() + (self._ttl if track_id is not None else self._negative_ttl)
+        self._remember(key, track_id, expires_at)
+
+        try:
+            await self._run(self._upsert, key, track_id, expires_at)
+        except sqlite3.Error:
+            # The in-memory cache still has it, so it's only lost on restart
+            log.exception("Failed to write to the resolution cache")
+
+    async def invalidate(self, key: str) -> None:
+        """Removes a key from the cache."""
+        self._entries.pop(key, None)
+
+        try:
+            await self._run(self._delete, key)
+        except sqlite3.Error:
+            log.exception("Failed to delete from the resolution cache")
+
+    async def clear(self) -> None:
+        """Removes every entry from the cache, including from the database."""
+        self._entries.clear()
+
+        try:
+            await self._run(self._delete, None)
+        except sqlite3.Error:
+            log.exception("Failed to clear the resolution cache")
+
+    async def close(self) -> None:
+        """Closes the database. It is opened again if the cache is used afterwards."""
+        await self._run(self._close)
@@ -0,0 +1,45 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Union
+
+import orjson
+
+__all__ = [
+    "Codec",
+    "JSONCodec",
+    "OrjsonCodec",
+]
+
+
+class Codec(ABC):
+    """The base class for the codec used to encode and decode all traffic to and from nodes.
+       Subclass this and pass an instance to `NodePool.set_codec()` to use a different JSON library.
+    """
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """Encodes an object into UTF-8 encoded JSON."""
+
+    @abstractmethod
+    def loads(self, data: Union[str, bytes]) -> Any:
+        """Decodes JSON from a string or UTF-8 encoded bytes."""
+
+
+class OrjsonCodec(Codec):
+    """Codec backed by orjson. This is the default codec."""
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+class JSONCodec(Codec):
+    """Codec backed by the standard library's json module."""
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
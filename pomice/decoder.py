@@ -0,0 +1,229 @@
+import struct
+from base64 import b64decode, b64encode
+from typing import List, Optional
+
+from .exceptions import TrackLoadError
+
+__all__ = [
+    "decode_track",
+    "decode_tracks",
+    "encode_track",
+]
+
+TRACK_INFO_VERSIONED = 1
+SUPPORTED_VERSIONS = (1, 2, 3)
+
+# Sources which write extra data between the source name and the position
+PROBE_INFO_SOURCES = ("http", "local")
+
+
+def _read_java_utf(data: bytes) -> str:
+    # Java's modified UTF-8 encodes NUL as two bytes and supplementary
+    # characters as surrogate pairs, which regular UTF-8 decoding rejects.
+    try:
+        return data.decode()
+    except UnicodeDecodeError:
+        text = data.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass")
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+
+def _write_java_utf(text: str) -> bytes:
+    if text.isascii() and "\x00" not in text:
+        return text.encode()
+
+    encoded = bytearray()
+    for char in text:
+        if char == "\x00":
+            encoded += b"\xc0\x80"
+        elif ord(char) > 0xFFFF:
+            high, low = struct.unpack(">HH", char.encode("utf-16-be"))
+            encoded += chr(high).encode("utf-8", "surrogatepass")
+            encoded += chr(low).encode("utf-8", "surrogatepass")
+        else:
+            encoded += char.encode()
+
+    return bytes(encoded)
+
+
+class _Reader:
+    __slots__ = ("_data", "_offset")
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._offset = 0
+
+    def _take(self, size: int) -> bytes:
+        end = self._offset + size
+        if end > len(self._data):
+            raise TrackLoadError("The track identifier is truncated.")
+
+        chunk = self._data[self._offset:end]
+        self._offset = end
+        return chunk
+
+    def read_byte(self) -> int:
+        return self._take(1)[0]
+
+    def read_bool(self) -> bool:
+        return self._take(1) != b"\x00"
+
+    def read_int(self) -> int:
+        return struct.unpack(">i", self._take(4))[0]
+
+    def read_long(self) -> int:
+        return struct.unpack(">q", self._take(8))[0]
+
+    def read_utf(self) -> str:
+        size = struct.unpack(">H", self._take(2))[0]
+        return _read_java_utf(self._take(size))
+
+    def read_nullable_utf(self) -> Optional[str]:
+        return self.read_utf() if self.read_bool() else None
+
+
+class _Writer:
+    __slots__ = ("_buffer",)
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def write_byte(self, value: int) -> None:
+        self._buffer.append(value)
+
+    def write_bool(self, value: bool) -> None:
+        self._buffer.append(1 if value else 0)
+
+    def write_long(self, value: int) -> None:
+        self._buffer += struct.pack(">q", value)
+
+    def write_utf(self, value: str) -> None:
+        encoded = _write_java_utf(value)
+        if len(encoded) > 0xFFFF:
+            raise ValueError("Strings cannot be longer than 65535 bytes when encoded.")
+
+        self._buffer += struct.pack(">H", len(encoded))
+        self._buffer += encoded
+
+    def write_nullable_utf(self, value: Optional[str]) -> None:
+        self.write_bool(value is not None)
+        if value is not None:
+            self.write_utf(value)
+
+    def finish(self, flags: int) -> bytes:
+        return struct.pack(">i", (flags << 30) | len(self._buffer)) + bytes(self._buffer)
+
+
+def decode_track(identifier: str) -> dict:
+    """Decodes a Lavalink track identifier locally, without making a request to a node.
+       Returns a dict in the same format as the info returned by Lavalink's REST API.
+       Raises TrackLoadError if the identifier is invalid or uses an unsupported version.
+    """
+    try:
+        data = b64decode(identifier, validate=True)
+    except ValueError:
+        raise TrackLoadError("The track identifier is not valid base64.")
+
+    reader = _Reader(data)
+    header = reader.read_int()
+    flags = (header >> 30) & 0x3
+    size = header & 0x3FFFFFFF
+
+    if size != len(data) - 4:
+        raise TrackLoadError("The track identifier has an invalid size.")
+
+    version = reader.read_byte() if flags & TRACK_INFO_VERSIONED else 1
+    if version not in SUPPORTED_VERSIONS:
+        raise TrackLoadError(f"Track identifiers of version {version} are not supported.")
+
+    title = reader.read_utf()
+    author = reader.read_utf()
+    length = reader.read_long()
+    track_identifier = reader.read_utf()
+    is_stream = reader.read_bool()
+    uri = reader.read_nullable_utf() if version >= 2 else None
+
+    artwork_url = isrc = None
+    if version >= 3:
+        artwork_url = reader.read_nullable_utf()
+        isrc = reader.read_nullable_utf()
+
+    source_name = reader.read_utf()
+
+    # Source specific data sits between the source name and the position,
+    # but the position is always the last 8 bytes of the message.
+    position = struct.unpack(">q", data[-8:])[0]
+
+    info = {
+        "title": title,
+        "author": author,
+        "length": length,
+        "identifier": track_identifier,
+        "isStream": is_stream,
+        "isSeekable": not is_stream,
+        "uri": uri,
+        "position": position,
+        "sourceName": source_name,
+        "isrc": isrc,
+    }
+
+    if artwork_url:
+        info["artworkUrl"] = artwork_url
+        info["thumbnail"] = artwork_url
+
+    return info
+
+
+def decode_tracks(identifiers: List[str]) -> List[Optional[dict]]:
+    """Decodes multiple Lavalink track identifiers locally.
+       Results are returned in the same order as the identifiers,
+       with None in place of any identifier that could not be decoded.
+    """
+    results = []
+    append = results.append
+
+    for identifier in identifiers:
+        try:
+            append(decode_track(identifier))
+        except TrackLoadError:
+            append(None)
+
+    return results
+
+
+def encode_track(info: dict, *, version: int = 2, probe_info: Optional[str] = None) -> str:
+    """Encodes track info into a Lavalink track identifier.
+       The info dict is in the same format as the one returned by `decode_track()`.
+
+       Tracks from the `http` and `local` sources need their `probe_info` (i.e: "mp3")
+       in order to be played by Lavalink.
+    """
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Track identifiers of version {version} are not supported.")
+
+    writer = _Writer()
+    if version > 1:
+        writer.write_byte(version)
+
+    writer.write_utf(info["title"])
+    writer.write_utf(info["author"])
+    writer.write_long(info["length"])
+    writer.write_utf(info["identifier"])
+    writer.write_bool(info.get("isStream", False))
+
+    if version >= 2:
+        writer.write_nullable_utf(info.get("uri"))
+
+    if version >= 3:
+        writer.write_nullable_utf(info.get("artworkUrl"))
+        writer.write_nullable_utf(info.get("isrc"))
+
+    source_name = info.get("sourceName", "youtube")
+    writer.write_utf(source_name)
+
+    if source_name in PROBE_INFO_SOURCES:
+        writer.write_utf(probe_info or "")
+
+    writer.write_long(info.get("position") or 0)
+
+    flags = TRACK_INFO_VERSIONED if version > 1 else 0
+    return b64encode(writer.finish(flags)).decode()
@@ -38,12 +38,22 @@ class NodeAlgorithm(Enum):
 
         NodeAlgorithm.by_players return a nodes based on how many players it has.
         This algorithm prefers nodes with the least amount of players.
+
+        NodeAlgorithm.by_load returns a node based on the load reported in its stats,
+        weighing CPU and Lavalink load, active players, memory usage and frame loss.
+        This algorithm prefers nodes with the lowest penalty.
+
+        NodeAlgorithm.by_guild returns a node based on a consistent hash of a guild ID,
+        or of a shard ID if one is given. The same guild keeps landing on the same node,
+        and adding or removing a node only moves a small share of guilds.
     """
 
     # We don't have to define anything special for these, since these just serve as flags
     by_ping = "BY_PING"
     by_region = "BY_REGION"
     by_players = "BY_PLAYERS"
+    by_load = "BY_LOAD"
+    by_guild = "BY_GUILD"
 
     def __str__(self) -> str:
         return self.value
@@ -64,4 +74,49 @@ class LoopMode(Enum):
     
 
     def __str__(self) -> str:
-        return self.value
\ No newline at end of file
+        return self.value
+
+
+class CircuitState(Enum):
+    """The enum for the different states of a node's circuit breaker.
+
+       CircuitState.closed means the node is healthy and can be selected.
+
+       CircuitState.open means the node has failed too many health checks
+       and will not be selected until it has had time to recover.
+
+       CircuitState.half_open means the node is recovering. It will only be selected
+       if there are no healthy nodes, until it passes enough health checks in a row.
+    """
+
+    closed = "CLOSED"
+    open = "OPEN"
+    half_open = "HALF_OPEN"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class NodeState(Enum):
+    """The enum for the different connection states of a node.
+
+       NodeState.disconnected means the node has not connected yet, or has been disconnected.
+
+       NodeState.connecting means the node is opening a connection to Lavalink.
+
+       NodeState.ready means the node is connected and can be used.
+
+       NodeState.backoff means the node lost its connection and is waiting
+       before it tries to reconnect.
+
+       NodeState.draining means the node is being disconnected and is cleaning up its players.
+    """
+
+    disconnected = "DISCONNECTED"
+    connecting = "CONNECTING"
+    ready = "READY"
+    backoff = "BACKOFF"
+    draining = "DRAINING"
+
+    def __str__(self) -> str:
+        return self.value
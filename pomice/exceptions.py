@@ -29,6 +29,16 @@ class NoNodesAvailable(PomiceException):
     pass
 
 
+class NodeRestException(PomiceException):
+    """There was a problem while making a request to a node's REST API."""
+    pass
+
+
+class OpDropped(PomiceException):
+    """An op was dropped before it was sent because the node's outbound queue was full."""
+    pass
+
+
 class TrackInvalidPosition(PomiceException):
     """An invalid position was chosen for a track."""
     pass
@@ -0,0 +1,280 @@
+"""Optional, dependency-free metrics for Pomice.
+
+Metrics are disabled by default. Once enabled with `pomice.metrics.enable()`,
+nodes, players and the Spotify client record counters, gauges and histograms
+which can be rendered in the Prometheus text exposition format with
+`pomice.metrics.render()`, i.e: to serve from your own HTTP endpoint.
+"""
+
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "disable",
+    "enable",
+    "registry",
+    "render",
+]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Holds every metric and whether recording is enabled.
+       While disabled, recording a metric returns immediately.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric named '{metric.name}' is already registered.")
+
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> "_Metric":
+        """Returns a registered metric by its name."""
+        return self._metrics[name]
+
+    def reset(self) -> None:
+        """Clears the recorded values of every metric."""
+        for metric in self._metrics.values():
+            metric._clear()
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric._render())
+
+        return "\n".join(lines) + "\n"
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        *,
+        registry: MetricsRegistry
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+        registry.register(self)
+
+    def __repr__(self) -> str:
+        return f"<Pomice.{self.__class__.__name__} name={self.name!r}>"
+
+    def value(self, *labelvalues: str) -> float:
+        """Returns the current value for a set of label values."""
+        return self._values.get(labelvalues, 0)
+
+    def _clear(self) -> None:
+        self._values.clear()
+
+    def _render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Counter(_Metric):
+    """A value which only goes up, such as the number of ops sent."""
+    type = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        if not self._registry.enabled:
+            return
+
+        values = self._values
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value which can go up and down, such as the number of connected players."""
+    type = "gauge"
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        if not self._registry.enabled:
+            return
+
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        if not self._registry.enabled:
+            return
+
+        values = self._values
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Counts observations, such as request durations, into fixed buckets."""
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        *,
+        registry: MetricsRegistry,
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        if not self._registry.enabled:
+            return
+
+        # Each series holds a count per bucket, then the +Inf count and the sum
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            self._values[labelvalues] = 0
+
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+        self._values[labelvalues] += 1
+
+    def _clear(self) -> None:
+        self._values.clear()
+        self._series.clear()
+
+    def sum(self, *labelvalues: str) -> float:
+        """Returns the sum of every observation for a set of label values."""
+        series = self._series.get(labelvalues)
+        return series[-1] if series else 0
+
+    def _render(self) -> List[str]:
+        lines = []
+        for labels, count in self._values.items():
+            series = self._series[labels]
+            cumulative = 0
+
+            for bound, bucket in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += bucket
+                bucket_labels = _format_labels(
+                    self.labelnames, labels, f'le="{_format_value(bound)}"'
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {_format_value(cumulative)}")
+
+            plain_labels = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain_labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{plain_labels} {_format_value(count)}")
+
+        return lines
+
+
+registry = MetricsRegistry()
+
+
+def enable() -> None:
+    """Starts recording metrics."""
+    registry.enabled = True
+
+
+def disable() -> None:
+    """Stops recording metrics. Values that were already recorded are kept."""
+    registry.enabled = False
+
+
+def render() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    return registry.render()
+
+
+OPS_SENT = Counter(
+    "pomice_ops_sent_total", "Ops sent to nodes over their websocket.",
+    ("node", "op"), registry=registry
+)
+FRAMES_RECEIVED = Counter(
+    "pomice_frames_received_total", "Payloads received from nodes over their websocket.",
+    ("node", "op"), registry=registry
+)
+REST_REQUESTS = Counter(
+    "pomice_rest_requests_total", "Requests made to node REST APIs.",
+    ("node", "endpoint", "status"), registry=registry
+)
+REST_LATENCY = Histogram(
+    "pomice_rest_request_duration_seconds", "Time taken by node REST requests, including retries.",
+    ("node", "endpoint"), registry=registry
+)
+TRACK_LOADS = Histogram(
+    "pomice_get_tracks_duration_seconds", "Time taken to load tracks with Node.get_tracks.",
+    ("node", "source"), registry=registry
+)
+TRACKS_BUILT = Counter(
+    "pomice_tracks_built_total", "Tracks built from identifiers.",
+    ("node", "decoder"), registry=registry
+)
+SPOTIFY_REQUESTS = Counter(
+    "pomice_spotify_requests_total", "Searches made with the Spotify client.",
+    ("type", "status"), registry=registry
+)
+SPOTIFY_LATENCY = Histogram(
+    "pomice_spotify_request_duration_seconds", "Time taken by Spotify searches.",
+    ("type",), registry=registry
+)
+NODE_RECONNECTS = Counter(
+    "pomice_node_reconnects_total", "Times a node reconnected after losing its connection.",
+    ("node",), registry=registry
+)
+INBOUND_DEPTH = Gauge(
+    "pomice_inbound_pipeline_depth", "Payloads from each node waiting to be processed.",
+    ("node",), registry=registry
+)
+INBOUND_LAG = Gauge(
+    "pomice_inbound_pipeline_lag_seconds",
+    "Moving average of how long payloads from each node wait before they're processed.",
+    ("node",), registry=registry
+)
+PLAYERS = Gauge(
+    "pomice_players", "Players connected to each node.",
+    ("node",), registry=registry
+)
+PLAYER_EVENTS = Counter(
+    "pomice_player_events_total",
+    "Player lifecycle events such as connects, destroys and node changes.",
+    ("event",), registry=registry
+)
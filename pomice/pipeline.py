@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+from . import metrics, tracing
+from .exceptions import NodeNotAvailable, OpDropped
+
+__all__ = [
+    "OutboundQueue",
+    "PayloadPipeline",
+]
+
+log = logging.getLogger(__name__)
+
+# Ops where only the latest payload for a guild matters
+COALESCED_OPS = frozenset(("volume", "filters", "seek", "pause", "equalizer"))
+
+# An op waiting to be sent, along with its caller's future and tracing span
+_QueuedOp = Tuple[dict, Optional[asyncio.Future], Optional[tracing.Span]]
+
+
+class PayloadPipeline:
+    """Processes inbound node payloads with a fixed set of workers.
+       Payloads for the same guild always go to the same worker, so they are
+       handled in the order they were received. Payloads without a guild, such as stats,
+       go to the first worker.
+
+       Each worker has a bounded queue. When a queue is full, `put()` waits for space,
+       which stops the node from reading more frames until the backlog clears.
+
+       If a name is given, the depth and lag are also recorded as metrics labelled with it.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        *,
+        workers: int = 4,
+        max_size: int = 1024,
+        name: Optional[str] = None
+    ) -> None:
+        self._handler = handler
+        self._worker_count = workers
+        self._name = name
+        self._queue_size = max(max_size // workers, 1)
+
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+        self.processed: int = 0
+        self.lag: float = 0.0
+        self.max_lag: float = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.PayloadPipeline workers={self._worker_count} depth={self.depth} "
+            f"lag={self.lag!r}>"
+        )
+
+    @property
+    def depth(self) -> int:
+        """Returns how many payloads are waiting to be processed."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    @property
+    def is_running(self) -> bool:
+        """Returns whether the workers have been started."""
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Starts the workers. This does nothing if they are already running."""
+        if self._tasks:
+            return
+
+        loop = asyncio.get_running_loop()
+        self._queues = [asyncio.Queue(maxsize=self._queue_size) for _ in range(self._worker_count)]
+        self._tasks = [loop.create_task(self._work(queue)) for queue in self._queues]
+
+    def stop(self) -> None:
+        """Stops the workers and drops any payloads that were not processed yet."""
+        for task in self._tasks:
+            task.cancel()
+
+        self._tasks = []
+        self._queues = []
+
+        if self._name is not None:
+            metrics.INBOUND_DEPTH.set(0, self._name)
+
+    async def put(self, data: dict) -> None:
+        """Queues a payload, waiting for space if its worker is falling behind."""
+        guild_id: Optional[str] = data.get("guildId")
+        index = int(guild_id) % self._worker_count if guild_id else 0
+
+        item: Tuple[float, dict] = (time.monotonic(), data)
+        await self._queues[index].put(item)
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            enqueued_at, data = await queue.get()
+
+            lag = time.monotonic() - enqueued_at
+            self.lag += 0.1 * (lag - self.lag)
+            self.max_lag = max(self.max_lag, lag)
+
+            if self._name is not None and metrics.registry.enabled:
+                metrics.INBOUND_LAG.set(self.lag, self._name)
+                metrics.INBOUND_DEPTH.set(self.depth, self._name)
+
+            try:
+                await self._handler(data)
+            except Exception:
+                log.exception("Ignoring exception while handling node payload %r", data.get("op"))
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+
+class OutboundQueue:
+    """Schedules the ops a node sends over its websocket.
+       Cosmetic ops (volume, filters, seek, pause and equalizer) are held for up to
+       `window` seconds, and only the latest one of each type is sent for a guild.
+       Every other op, such as play, stop and destroy, is sent ahead of them as soon as possible.
+
+       Any cosmetic ops still waiting for a guild are sent before that guild's next play or stop,
+       and are dropped when the guild's player is destroyed.
+
+       At most `max_size` ops can be waiting. When full, the oldest cosmetic op is dropped
+       and passed to `on_error` with an `OpDropped` error, or if there are none,
+       new ops wait for space.
+
+       `put()` returns a future for every op other than cosmetic ones, which holds the error
+       if sending it failed. Failures of cosmetic ops are passed to `on_error` instead.
+       Ops are sent under the tracing span that was current when they were queued.
+    """
+
+    def __init__(
+        self,
+        sender: Callable[[dict], Awaitable[None]],
+        *,
+        window: float = 0.05,
+        max_size: int = 1024,
+        on_error: Optional[Callable[[dict, Exception], None]] = None
+    ) -> None:
+        self._sender = sender
+        self._window = window
+        self._max_size = max_size
+        self._on_error = on_error
+
+        self._urgent: Deque[_QueuedOp] = deque()
+        self._coalesced: "OrderedDict[Tuple[Optional[str], str], _QueuedOp]" = OrderedDict()
+        self._coalesced_since: float = 0.0
+
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._flushing = False
+        self._sending = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.sent: int = 0
+        self.superseded: int = 0
+        self.dropped: int = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.OutboundQueue size={self.size} sent={self.sent} "
+            f"superseded={self.superseded} dropped={self.dropped}>"
+        )
+
+    @property
+    def size(self) -> int:
+        """Returns how many ops are waiting to be sent."""
+        return len(self._urgent) + len(self._coalesced)
+
+    def start(self) -> None:
+        """Starts sending ops. This does nothing if the queue is already running."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        """Stops sending ops and drops any that are still waiting."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        for _, waiter, _ in self._urgent:
+            if waiter and not waiter.done():
+                waiter.set_exception(
+                    NodeNotAvailable("The node was disconnected before the op could be sent.")
+                )
+
+        self._urgent.clear()
+        self._coalesced.clear()
+
+    async def put(self, data: dict) -> Optional[asyncio.Future]:
+        """Queues an op to be sent. Returns a future which is done once the op has been sent,
+           or None for cosmetic ops.
+        """
+        op = data.get("op")
+        guild_id = data.get("guildId")
+        parent = tracing.current_span()
+
+        if op in COALESCED_OPS:
+            key = (guild_id, op)
+            if key in self._coalesced:
+                self._coalesced[key] = (data, None, parent)
+                self.superseded += 1
+                return None
+
+            await self._wait_for_space()
+            if not self._coalesced:
+                self._coalesced_since = time.monotonic()
+            self._coalesced[key] = (data, None, parent)
+            waiter = None
+        else:
+            await self._wait_for_space()
+            for key in [key for key in self._coalesced if key[0] == guild_id]:
+                pending = self._coalesced.pop(key)
+                if op == "destroy":
+                    self.superseded += 1
+                else:
+                    self._urgent.append(pending)
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._urgent.append((data, waiter, parent))
+
+        self._wakeup.set()
+        return waiter
+
+    async def flush(self) -> None:
+        """Sends every waiting op right away and waits until they have all been sent."""
+        self._flushing = True
+        try:
+            while (self.size or self._sending) and self._task and not self._task.done():
+                self._wakeup.set()
+                self._space.clear()
+                await self._space.wait()
+        finally:
+            self._flushing = False
+
+    async def _wait_for_space(self) -> None:
+        while self.size >= self._max_size:
+            if self._coalesced:
+                _, (data, _, _) = self._coalesced.popitem(last=False)
+                self.dropped += 1
+                self._failed(
+                    data, OpDropped("The op was dropped because the outbound queue was full.")
+                )
+                return
+
+            self._space.clear()
+            await self._space.wait()
+
+    def _failed(self, data: dict, exc: Exception) -> None:
+        if self._on_error:
+            self._on_error(data, exc)
+        else:
+            log.error("Failed to send %r op", data.get("op"), exc_info=exc)
+
+    async def _send(
+        self,
+        data: dict,
+        waiter: Optional[asyncio.Future],
+        parent: Optional[tracing.Span]
+    ) -> None:
+        self._sending = True
+        try:
+            with tracing.use_span(parent):
+                await self._sender(data)
+            self.sent += 1
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+        except asyncio.CancelledError:
+            if waiter and not waiter.done():
+                waiter.set_exception(
+                    NodeNotAvailable("The node was disconnected before the op could be sent.")
+                )
+            raise
+        except Exception as exc:
+            if waiter:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            else:
+                self._failed(data, exc)
+        finally:
+            self._sending = False
+            self._space.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._urgent:
+                await self._send(*self._urgent.popleft())
+
+            if not self._coalesced:
+                continue
+
+            remaining = self._coalesced_since + self._window - time.monotonic()
+            if remaining > 0 and not self._flushing:
+                try:
+                    # Wake up early if an urgent op comes in while we wait
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+            while self._coalesced:
+                _, queued = self._coalesced.popitem(last=False)
+                await self._send(*queued)
@@ -14,13 +14,24 @@ from discord import (
 )
 from discord.ext import commands
 
-from . import events
-from .enums import SearchType
+from . import events, metrics, tracing
+from .enums import NodeAlgorithm, SearchType
 from .events import PomiceEvent, TrackEndEvent, TrackStartEvent
-from .exceptions import FilterInvalidArgument, FilterTagAlreadyInUse, FilterTagInvalid, TrackInvalidPosition, TrackLoadError
+from .exceptions import (
+    FilterInvalidArgument,
+    FilterTagAlreadyInUse,
+    FilterTagInvalid,
+    NodeNotAvailable,
+    NoNodesAvailable,
+    TrackInvalidPosition,
+    TrackLoadError
+)
 from .filters import Filter
 from .objects import Track
 from .pool import Node, NodePool
+from .prefetch import Prefetcher
+from .queue import Queue
+from .utils import get_voice_region
 
 class Filters:
     """Helper class for filters"""
@@ -95,7 +106,9 @@ class Player(VoiceProtocol):
         self.channel = channel
         self._guild = channel.guild if channel else None
 
-        self._node = node if node else NodePool.get_node()
+        self._region: Optional[str] = None
+        self._node = node if node else self._choose_node()
+        self._node_chosen = node is None
         self._current: Track = None
         self._filters: Filters = Filters()
         self._volume = 100
@@ -108,6 +121,41 @@ class Player(VoiceProtocol):
         self._ending_track: Optional[Track] = None
 
         self._voice_state = {}
+        self._prefetcher: Optional[Prefetcher] = None
+
+    def _choose_node(self) -> Node:
+        algorithm = NodePool._default_algorithm
+        if algorithm is None and self._region:
+            algorithm = NodeAlgorithm.by_region
+
+        guild = self._guild
+        if algorithm is None or (algorithm is NodeAlgorithm.by_guild and not guild):
+            return NodePool.get_node()
+
+        # Guilds are only kept together by shard when the bot is actually sharded
+        sharded = (getattr(self._bot, "shard_count", None) or 1) > 1
+        return NodePool.get_best_node(
+            algorithm=algorithm,
+            region=self._region,
+            guild_id=guild.id if guild else None,
+            shard_id=guild.shard_id if guild and sharded else None
+        )
+
+    def _node_in_region(self) -> Optional[Node]:
+        if (
+            not self._node_chosen
+            or not self._region
+            or NodePool._default_algorithm is NodeAlgorithm.by_guild
+            or self._node._in_region(self._region)
+        ):
+            return None
+
+        try:
+            node = NodePool.get_best_node(algorithm=NodeAlgorithm.by_region, region=self._region)
+        except NoNodesAvailable:
+            return None
+
+        return node if node._in_region(self._region) else None
 
     def __repr__(self):
         return (
@@ -118,11 +166,11 @@ class Player(VoiceProtocol):
     @property
     def position(self) -> float:
         """Property which returns the player's position in a track in milliseconds"""
-        current = self._current.original
-
         if not self.is_playing or not self._current:
             return 0
 
+        current = self._current.original
+
         if self.is_paused:
             return min(self._last_position, current.length)
 
@@ -164,6 +212,13 @@ class Player(VoiceProtocol):
         """Property which returns the guild associated with the player"""
         return self._guild
 
+    @property
+    def region(self) -> Optional[str]:
+        """Property which returns the voice region of the player's voice server, i.e: "us-east".
+           This is None until the player has connected to a voice channel.
+        """
+        return self._region
+
     @property
     def volume(self) -> int:
         """Property which returns the players current volume"""
@@ -174,6 +229,11 @@ class Player(VoiceProtocol):
         """Property which returns the helper class for interacting with filters"""
         return self._filters
 
+    @property
+    def prefetcher(self) -> Optional[Prefetcher]:
+        """Property which returns the prefetcher for this player, if prefetching is enabled"""
+        return self._prefetcher
+
     @property
     def bot(self) -> Client:
         """Property which returns the bot associated with this player instance"""
@@ -203,8 +263,14 @@ class Player(VoiceProtocol):
         )
 
     async def on_voice_server_update(self, data: dict):
+        self._region = get_voice_region(data.get("endpoint"))
         self._voice_state.update({"event": data})
-        await self._dispatch_voice_update(self._voice_state)
+
+        # Players placed before their region was known are moved to a node in it
+        if node := self._node_in_region():
+            await self.change_node(node)
+        else:
+            await self._dispatch_voice_update(self._voice_state)
 
     async def on_voice_state_update(self, data: dict):
         self._voice_state.update({"sessionId": data.get("session_id")})
@@ -254,8 +320,52 @@ class Player(VoiceProtocol):
     async def connect(self, *, timeout: float, reconnect: bool, self_deaf: bool = False, self_mute: bool = False):
         await self.guild.change_voice_state(channel=self.channel, self_deaf=self_deaf, self_mute=self_mute)
         self._node._players[self.guild.id] = self
+        NodePool._players[self.guild.id] = self
         self._is_connected = True
 
+        metrics.PLAYERS.inc(self._node._identifier)
+        metrics.PLAYER_EVENTS.inc("connect")
+
+    async def change_node(self, new_node: Node):
+        """Moves the player to another node.
+           The voice connection is handed over to the new node, and the current track
+           is replayed from its last known position with the same volume, pause state and filters.
+        """
+        position = self.position
+        old_node = self._node
+
+        old_node._players.pop(self.guild.id, None)
+        metrics.PLAYERS.dec(old_node._identifier)
+        if old_node.is_connected:
+            try:
+                await old_node.send(op="destroy", guildId=str(self.guild.id))
+            except NodeNotAvailable:
+                pass
+
+        self._node = new_node
+        new_node._players[self.guild.id] = self
+        metrics.PLAYERS.inc(new_node._identifier)
+        metrics.PLAYER_EVENTS.inc("change_node")
+
+        await self._dispatch_voice_update(self._voice_state)
+
+        if self._current and self._current.original:
+            await self._node.send(
+                op="play",
+                guildId=str(self.guild.id),
+                track=self._current.original.track_id,
+                startTime=str(int(position)),
+                pause=self._paused
+            )
+            self._last_position = position
+            self._last_update = time.time() * 1000
+
+        if self._volume != 100:
+            await self._node.send(op="volume", guildId=str(self.guild.id), volume=self._volume)
+
+        if payload := self._filters.get_all_payloads():
+            await self._node.send(op="filters", guildId=str(self.guild.id), **payload)
+
     async def stop(self):
         """Stops the currently playing track."""
         self._current = None
@@ -279,7 +389,11 @@ class Player(VoiceProtocol):
             # assume we're already disconnected and cleaned up
             assert self.channel is None and not self.is_connected
 
+        self.disable_prefetch()
         self._node._players.pop(self.guild.id)
+        NodePool._players.pop(self.guild.id, None)
+        metrics.PLAYERS.dec(self._node._identifier)
+        metrics.PLAYER_EVENTS.inc("destroy")
         await self._node.send(op="destroy", guildId=str(self.guild.id))
 
     async def play(
@@ -291,49 +405,92 @@ class Player(VoiceProtocol):
         ignore_if_playing: bool = False
     ) -> Track:
         """Plays a track. If a Spotify track is passed in, it will be handled accordingly."""
-        if track.spotify: 
-            # First lets try using the tracks ISRC, every track has one (hopefully)
-            try:
-                if not track.isrc:
-                    # We have to bare raise here because theres no other way to skip this block feasibly 
-                    raise 
-                search: Track = (await self._node.get_tracks(
-                f"{track._search_type}:{track.isrc}", ctx=track.ctx))[0]
-            except:
-                # First method didn't work, lets try just searching it up
-                try:
-                    search: Track = (await self._node.get_tracks(
-                    f"{track._search_type}:{track.title} - {track.author}", ctx=track.ctx))[0]
-                except:
-                    # The song wasn't able to be found, raise error
-                    raise TrackLoadError (
-                        "No equivalent track was able to be found."
-                    )
-            data = {
-                "op": "play",
-                "guildId": str(self.guild.id),
-                "track": search.track_id,
-                "startTime": str(start),
-                "noReplace": ignore_if_playing
-            }    
-            track.original = search
-        else:
-            data = {
-                "op": "play",
-                "guildId": str(self.guild.id),
-                "track": track.track_id,
-                "startTime": str(start),
-                "noReplace": ignore_if_playing
-            }
-
-        if end > 0:
-            data["endTime"] = str(end)
-
-        await self._node.send(**data)
+        with tracing.span("pomice.player.play", guild=self.guild.id, spotify=track.spotify):
+            if track.spotify:
+                search = track.original
+                if not search and self._prefetcher:
+                    search = await self._prefetcher.wait_for(track)
+                if not search:
+                    search = await self._resolve_track(track)
+
+                data = {
+                    "op": "play",
+                    "guildId": str(self.guild.id),
+                    "track": search.track_id,
+                    "startTime": str(start),
+                    "noReplace": ignore_if_playing
+                }
+                track.original = search
+            else:
+                data = {
+                    "op": "play",
+                    "guildId": str(self.guild.id),
+                    "track": track.track_id,
+                    "startTime": str(start),
+                    "noReplace": ignore_if_playing
+                }
+
+            if end > 0:
+                data["endTime"] = str(end)
+
+            await self._node.send(**data)
 
         self._current = track
         return self._current
 
+    async def _resolve_track(self, track: Track) -> Track:
+        """Finds the Lavalink equivalent of a Spotify track.
+           The pool's resolution cache is checked first, and updated with the result, if one is set.
+        """
+        cache = NodePool._resolution_cache
+        key = cache.key_for(track) if cache is not None else None
+
+        with tracing.span("pomice.player.resolve", title=track.title, isrc=track.isrc) as span:
+            if key:
+                found, identifier = await cache.get(key)
+                if found:
+                    span.set_attribute("method", "cache")
+                    if identifier is None:
+                        raise TrackLoadError(
+                            "No equivalent track was able to be found."
+                        )
+
+                    try:
+                        return await self._node.build_track(identifier, ctx=track.ctx)
+                    except TrackLoadError:
+                        # The cached track can't be played anymore, so search for it again
+                        await cache.invalidate(key)
+
+            # First lets try using the tracks ISRC, every track has one (hopefully),
+            # and if that doesn't work, lets try just searching it up
+            queries = [("title", f"{track._search_type}:{track.title} - {track.author}")]
+            if track.isrc:
+                queries.insert(0, ("isrc", f"{track._search_type}:{track.isrc}"))
+
+            failed = False
+            for method, query in queries:
+                with tracing.span(f"pomice.player.resolve.{method}"):
+                    try:
+                        results = await self._node.get_tracks(query, ctx=track.ctx)
+                    except Exception:
+                        failed = True
+                        continue
+
+                if isinstance(results, list) and results:
+                    span.set_attribute("method", method)
+                    if key:
+                        await cache.set(key, results[0].track_id)
+                    return results[0]
+
+            # Only remember that there's no equivalent if the node answered every search
+            if key and not failed:
+                await cache.set(key, None)
+
+        # The song wasn't able to be found, raise error
+        raise TrackLoadError(
+            "No equivalent track was able to be found."
+        )
+
     async def seek(self, position: float) -> float:
         """Seeks to a position in the currently playing track milliseconds"""
         if position < 0 or position > self._current.original.length:
@@ -350,6 +507,22 @@ class Player(VoiceProtocol):
         self._paused = pause
         return self._paused
 
+    def enable_prefetch(self, queue: Queue, *, depth: int = 2) -> Prefetcher:
+        """Starts finding the Lavalink equivalents of the next `depth` Spotify tracks in a queue
+           in the background, so they can be played without waiting on a search.
+           This replaces any prefetcher that was already enabled.
+        """
+        self.disable_prefetch()
+        self._prefetcher = Prefetcher(self, queue, depth=depth)
+        self._prefetcher.start()
+        return self._prefetcher
+
+    def disable_prefetch(self):
+        """Stops prefetching tracks, if it was enabled."""
+        if self._prefetcher:
+            self._prefetcher.stop()
+            self._prefetcher = None
+
     async def set_volume(self, volume: int) -> int:
         """Sets the volume of the player as an integer. Lavalink accepts values from 0 to 500."""
         await self._node.send(op="volume", guildId=str(self.guild.id), volume=volume)
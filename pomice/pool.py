@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import logging
 import random
 import re
-from typing import Dict, Optional, TYPE_CHECKING
-from urllib.parse import quote
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
 
 import aiohttp
 from discord import Client
@@ -14,25 +15,43 @@ from discord.ext import commands
 
 from . import (
     __version__, 
+    metrics,
     spotify,
+    tracing,
 )
 
-from .enums import SearchType, NodeAlgorithm
+from .cache import ResolutionCache, TrackCache, normalize_query
+from .codec import Codec, OrjsonCodec
+from .decoder import decode_track
+from .enums import CircuitState, NodeAlgorithm, NodeState, SearchType
 from .exceptions import (
     InvalidSpotifyClientAuthorization,
     NodeConnectionFailure,
     NodeCreationError,
     NodeException,
     NodeNotAvailable,
+    NodeRestException,
     NoNodesAvailable,
     TrackLoadError
 )
 from .objects import Playlist, Track
-from .utils import ExponentialBackoff, NodeStats, Ping
+from .pipeline import OutboundQueue, PayloadPipeline
+from .recorder import TrafficRecorder
+from .utils import (
+    CircuitBreaker,
+    ExponentialBackoff,
+    HashRing,
+    LatencyTracker,
+    NodeStats,
+    Ping,
+    RequestLimiter
+)
 
 if TYPE_CHECKING:
     from .player import Player
 
+log = logging.getLogger(__name__)
+
 SPOTIFY_URL_REGEX = re.compile(
     r"https?://open.spotify.com/(?P<type>album|playlist|track|artist)/(?P<id>[a-zA-Z0-9]+)"
 )
@@ -46,12 +65,68 @@ URL_REGEX = re.compile(
     r"https?://(?:www\.)?.+"
 )
 
+# How often, in seconds, each node measures its latency in the background
+LATENCY_SAMPLE_INTERVAL = 15
+
+# REST responses which mean the node, or whatever it's loading from, is throttling us
+REST_RETRY_STATUSES = (429, 502, 503, 504)
+REST_MAX_RETRIES = 3
+
+# The base and cap, in seconds, of the delay between reconnect attempts
+RECONNECT_BACKOFF_BASE = 1
+RECONNECT_MAX_DELAY = 60
+
+# Websocket messages which mean the connection to the node is gone
+CLOSED_MESSAGE_TYPES = (
+    aiohttp.WSMsgType.CLOSE,
+    aiohttp.WSMsgType.CLOSING,
+    aiohttp.WSMsgType.CLOSED,
+    aiohttp.WSMsgType.ERROR,
+)
+
+# The only gateway events the pool cares about
+VOICE_EVENTS = frozenset(("VOICE_SERVER_UPDATE", "VOICE_STATE_UPDATE"))
+
+# How many workers process inbound payloads for each node, and how many payloads can be queued
+INBOUND_WORKERS = 4
+INBOUND_QUEUE_SIZE = 1024
+
+# How long, in seconds, cosmetic ops are held so they can be superseded,
+# and how many ops can be queued
+OUTBOUND_WINDOW = 0.05
+OUTBOUND_QUEUE_SIZE = 1024
+
+# How often, in seconds, each node checks its own health, and how long each check may take
+HEALTH_CHECK_INTERVAL = 5
+HEALTH_CHECK_TIMEOUT = 5
+
 
 
 class Node:
     """The base class for a node. 
        This node object represents a Lavalink node. 
        To enable Spotify searching, pass in a proper Spotify Client ID and Spotify Client Secret
+
+       Unless a session is passed in, the node uses the HTTP session shared by the whole pool.
+
+       To enable region-aware node selection, pass in the voice region the node is hosted in,
+       i.e: "us-east" or "rotterdam".
+       A region like "us" will match every voice region starting with it.
+       Once a player connects, it's moved to a node in the region of its voice server
+       if it isn't on one, unless it was created with a node
+       or the pool uses NodeAlgorithm.by_guild.
+
+       If the connection to Lavalink is lost, the node reconnects on its own with backoff.
+       Every change in its connection state is dispatched as
+       `on_pomice_node_state_change(node, old_state, new_state)`.
+
+       At most `rest_concurrency` REST requests are sent to the node at once, with up to
+       `rest_queue_size` more waiting for a slot. Throttled requests are retried with backoff.
+
+       To enable session resuming, pass in a resume key. Ops sent while the node is reconnecting
+       are buffered (up to `resume_buffer_size` ops) and sent once the session is resumed.
+
+       To record the node's traffic for replaying later, pass in a TrafficRecorder.
     """
 
     def __init__(
@@ -68,6 +143,13 @@ class Node:
         session: Optional[aiohttp.ClientSession] = None,
         spotify_client_id: Optional[str] = None,
         spotify_client_secret: Optional[str] = None,
+        resume_key: Optional[str] = None,
+        resume_timeout: int = 60,
+        resume_buffer_size: int = 100,
+        rest_concurrency: int = 16,
+        rest_queue_size: int = 256,
+        region: Optional[str] = None,
+        recorder: Optional[TrafficRecorder] = None,
 
     ):
         self._bot = bot
@@ -78,18 +160,33 @@ class Node:
         self._identifier = identifier
         self._heartbeat = heartbeat
         self._secure = secure
+        self._region = region.lower() if region else None
+        self._resume_key = resume_key
+        self._resume_timeout = resume_timeout
+        self._recorder = recorder
 
        
         self._websocket_uri = f"{'wss' if self._secure else 'ws'}://{self._host}:{self._port}"    
         self._rest_uri = f"{'https' if self._secure else 'http'}://{self._host}:{self._port}"
 
-        self._session = session or aiohttp.ClientSession()
+        self._session = session or self._pool._get_session()
         self._websocket: aiohttp.ClientWebSocketResponse = None
         self._task: asyncio.Task = None
+        self._state = NodeState.disconnected
+        self._latency_task: asyncio.Task = None
+        self._health_task: asyncio.Task = None
+        self._failover_task: asyncio.Task = None
+
+        self._resumable = False
+        self._buffer: Deque[dict] = deque()
+        self._buffer_size = resume_buffer_size
 
         self._connection_id = None
         self._metadata = None
         self._available = None
+        self._stats: Optional[NodeStats] = None
+        self._latency = LatencyTracker()
+        self._breaker = CircuitBreaker()
 
         self._headers = {
             "Authorization": self._password,
@@ -98,16 +195,31 @@ class Node:
         }
 
         self._players: Dict[int, Player] = {}
+        self._pipeline = PayloadPipeline(
+            self._handle_payload,
+            workers=INBOUND_WORKERS,
+            max_size=INBOUND_QUEUE_SIZE,
+            name=self._identifier
+        )
+        self._outbound = OutboundQueue(
+            self._send_now,
+            window=OUTBOUND_WINDOW,
+            max_size=OUTBOUND_QUEUE_SIZE,
+            on_error=self._op_failed
+        )
+        self._rest_limiter = RequestLimiter(
+            max_concurrency=rest_concurrency, max_queue=rest_queue_size
+        )
 
         self._spotify_client_id = spotify_client_id
         self._spotify_client_secret = spotify_client_secret
 
         if self._spotify_client_id and self._spotify_client_secret:
-            self._spotify_client = spotify.Client(
+            self._spotify_client = self._pool._get_spotify_client(
                 self._spotify_client_id, self._spotify_client_secret
             )
 
-        self._bot.add_listener(self._update_handler, "on_socket_response")
+        self._pool._register_dispatcher(self._bot)
 
     def __repr__(self):
         return (
@@ -121,11 +233,77 @@ class Node:
         return self._websocket is not None and not self._websocket.closed
 
 
+    @property
+    def state(self) -> NodeState:
+        """Property which returns the connection state of this node"""
+        return self._state
+
+    @property
+    def region(self) -> Optional[str]:
+        """Property which returns the voice region this node is hosted in, if one was set"""
+        return self._region
+
+    def _in_region(self, region: str) -> bool:
+        return bool(self._region) and region.startswith(self._region)
+
+    @property
+    def recorder(self) -> Optional[TrafficRecorder]:
+        """Property which returns the recorder this node's traffic is written to, if one was set"""
+        return self._recorder
+
+    @property
+    def is_available(self) -> bool:
+        """Property which returns whether this node can be selected for new players.
+           A node is unavailable while it is disconnected or its circuit breaker is open.
+        """
+        return bool(self._available) and self._breaker.state is not CircuitState.open
+
+    @property
+    def circuit_state(self) -> CircuitState:
+        """Property which returns the state of this node's circuit breaker"""
+        return self._breaker.state
+
     @property
     def stats(self) -> NodeStats:
         """Property which returns the node stats."""
         return self._stats
 
+    @property
+    def penalty(self) -> float:
+        """Property which returns the load penalty of the node, calculated from its stats.
+           If the node has not reported any stats yet, this returns infinity.
+        """
+        if not self._stats:
+            return float("inf")
+
+        return self._stats.penalty
+
+    @property
+    def rest_queue_wait(self) -> float:
+        """Property which returns the average time in seconds REST requests
+           spent waiting for a free slot on this node.
+        """
+        return self._rest_limiter.average_wait
+
+    @property
+    def rest_queue_depth(self) -> int:
+        """Property which returns how many REST requests are waiting for a free slot
+           on this node.
+        """
+        return self._rest_limiter.waiting
+
+    @property
+    def inbound_queue_depth(self) -> int:
+        """Property which returns how many payloads from this node are waiting to be processed."""
+        return self._pipeline.depth
+
+    @property
+    def inbound_lag(self) -> float:
+        """Property which returns the average time in seconds payloads from this node
+           wait before they are processed.
+        """
+        return self._pipeline.lag
+
     @property
     def players(self) -> Dict[int, Player]:
         """Property which returns a dict containing the guild ID and the player object."""
@@ -148,55 +326,137 @@ class Node:
         return self._pool
 
     @property
-    def latency(self):
-        """Property which returns the latency of the node"""
-        return Ping(self._host, port=self._port).get_ping()
+    def latency(self) -> float:
+        """Property which returns the average latency of the node in milliseconds.
+           This value is sampled in the background, so reading it never blocks.
+           If the node has not been sampled yet, this returns infinity.
+        """
+        if self._latency.average is None:
+            return float("inf")
 
-    async def _update_handler(self, data: dict):
-        await self._bot.wait_until_ready()
+        return self._latency.average
 
-        if not data:
-            return
+    @property
+    def jitter(self) -> float:
+        """Property which returns the estimated latency jitter of the node in milliseconds"""
+        return self._latency.jitter
 
-        if data["t"] == "VOICE_SERVER_UPDATE":
-            guild_id = int(data["d"]["guild_id"])
+    async def _sample_latency(self):
+        ping = Ping(self._host, port=self._port)
+
+        while True:
             try:
-                player = self._players[guild_id]
-                await player.on_voice_server_update(data["d"])
-            except KeyError:
-                return
+                self._latency.update(await ping.get_ping())
+            except (asyncio.TimeoutError, OSError):
+                # Treat an unreachable node as if it took the whole timeout to respond
+                self._latency.update(ping._timeout * 1000)
+
+            await asyncio.sleep(LATENCY_SAMPLE_INTERVAL)
+
+    async def _check_health(self):
+        timeout = aiohttp.ClientTimeout(total=HEALTH_CHECK_TIMEOUT)
+
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+            healthy = self.is_connected
+            if healthy:
+                try:
+                    async with self._session.get(
+                        f"{self._rest_uri}/version",
+                        headers={"Authorization": self._password},
+                        timeout=timeout
+                    ) as resp:
+                        healthy = resp.status == 200
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    healthy = False
+
+            if healthy:
+                self._breaker.record_success()
+            else:
+                self._breaker.record_failure()
+
+    def _set_state(self, state: NodeState):
+        old_state = self._state
+        if old_state is state:
+            return
+
+        self._state = state
+        self._bot.dispatch("pomice_node_state_change", self, old_state, state)
 
-        elif data["t"] == "VOICE_STATE_UPDATE":
-            if int(data["d"]["user_id"]) != self._bot.user.id:
+    def _op_failed(self, data: dict, exc: Exception):
+        # Cosmetic ops are coalesced after their callers return, so their failures are dispatched
+        self._bot.dispatch("pomice_op_error", self, data, exc)
+
+    async def _listen(self):
+        while True:
+            msg = await self._websocket.receive()
+            if msg.type in CLOSED_MESSAGE_TYPES:
                 return
 
-            guild_id = int(data["d"]["guild_id"])
+            if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                if self._recorder:
+                    self._recorder.record_inbound(self._identifier, msg.data)
+
+                # A malformed frame only affects itself, it never takes down the connection
+                try:
+                    await self._pipeline.put(self._pool._codec.loads(msg.data))
+                except Exception:
+                    log.exception("Ignoring malformed frame from node '%s'", self._identifier)
+                    continue
+
+    async def _connection_lost(self):
+        if not self._websocket.closed:
+            await self._websocket.close()
+
+        if not self._available:
+            return
+
+        self._available = False
+        if self._resume_key:
+            # Give the session a chance to be resumed before moving players away
+            self._failover_task = self._bot.loop.create_task(self._failover_after_timeout())
+        else:
+            await self._pool._failover(self)
+
+    async def _supervise(self):
+        # This is the only task that ever reconnects the node, so there is
+        # never more than one connection attempt in flight.
+        while True:
             try:
-                player = self._players[guild_id]
-                await player.on_voice_state_update(data["d"])
-            except KeyError:
+                await self._listen()
+            except Exception:
+                # Treat anything that breaks the listener as a lost connection
+                log.exception("Lost the connection to node '%s'", self._identifier)
+
+            if self._state is NodeState.draining:
                 return
 
-    async def _listen(self):
-        backoff = ExponentialBackoff(base=7)
+            await self._connection_lost()
 
-        while True:
-            msg = await self._websocket.receive()
-            if msg.type == aiohttp.WSMsgType.CLOSED:
-                retry = backoff.delay()
-                await asyncio.sleep(retry)
-                if not self.is_connected:
-                    self._bot.loop.create_task(self.connect())
-            else:
-                self._bot.loop.create_task(self._handle_payload(msg.json()))
+            backoff = ExponentialBackoff(base=RECONNECT_BACKOFF_BASE)
+            while True:
+                self._set_state(NodeState.backoff)
+                await asyncio.sleep(min(backoff.delay(), RECONNECT_MAX_DELAY))
+
+                self._set_state(NodeState.connecting)
+                try:
+                    await self._open_websocket()
+                    metrics.NODE_RECONNECTS.inc(self._identifier)
+                    break
+                except (NodeConnectionFailure, aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                    continue
 
     async def _handle_payload(self, data: dict):
         op = data.get("op", None)
         if not op:
             return
 
+        metrics.FRAMES_RECEIVED.inc(self._identifier, op)
+
         if op == "stats":
             self._stats = NodeStats(data)
+            self._pool._update_load_ranking(self)
             return
 
         if not (player := self._players.get(int(data["guildId"]))):
@@ -207,13 +467,134 @@ class Node:
         elif op == "playerUpdate":
             await player._update_state(data)
 
+    async def _failover_after_timeout(self):
+        await asyncio.sleep(self._resume_timeout)
+        if not self._available:
+            self._resumable = False
+            self._buffer.clear()
+            await self._pool._failover(self)
+
+    async def _restore_session(self, resumed: bool):
+        if self._failover_task:
+            self._failover_task.cancel()
+            self._failover_task = None
+
+        if resumed:
+            return
+
+        # Lavalink started a new session, so none of our players exist on its side anymore
+        for player in list(self._players.values()):
+            try:
+                await player.change_node(self)
+            except Exception as exc:
+                self._bot.dispatch("pomice_failover_error", player, exc)
+
     async def send(self, **data):
+        """Queues an op to be sent to the node.
+           Bursts of volume, filter, seek and pause ops for the same guild are collapsed,
+           so only the latest one is sent. Failures to send those, or those dropped
+           because the queue was full, are dispatched as `on_pomice_op_error`,
+           while any other op raises them.
+        """
+        if not self._available and not (
+            self._resumable and len(self._buffer) < self._buffer_size
+        ):
+            raise NodeNotAvailable(
+                f"The node '{self._identifier}' is unavailable."
+            )
+
+        with tracing.span("pomice.node.send", node=self._identifier, op=data.get("op")):
+            if waiter := await self._outbound.put(data):
+                await waiter
+
+    async def _send_now(self, data: dict):
         if not self._available:
+            if self._resumable and len(self._buffer) < self._buffer_size:
+                self._buffer.append(data)
+                return
+
             raise NodeNotAvailable(
                 f"The node '{self._identifier}' is unavailable."
             )
 
-        await self._websocket.send_str(json.dumps(data))
+        with tracing.span("pomice.node.websocket_send", node=self._identifier, op=data.get("op")):
+            await self._send_payload(self._pool._codec.dumps(data))
+        metrics.OPS_SENT.inc(self._identifier, data.get("op"))
+
+    async def _send_payload(self, payload: bytes):
+        if self._recorder:
+            self._recorder.record_outbound(self._identifier, payload)
+
+        # Newer versions of aiohttp can send the encoded payload as a text frame as-is,
+        # older ones need it as a string which they then encode again.
+        if hasattr(self._websocket, "send_frame"):
+            await self._websocket.send_frame(payload, aiohttp.WSMsgType.TEXT)
+        else:
+            await self._websocket.send_str(payload.decode())
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[dict] = None,
+        json: Any = None
+    ) -> Tuple[int, Any]:
+        """Makes a request to the node's REST API and returns the status and decoded body.
+           The body is None if the request was not successful.
+        """
+        backoff = ExponentialBackoff(base=1)
+        codec: Codec = self._pool._codec
+
+        headers = {"Authorization": self._password}
+        body = None
+        if json is not None:
+            headers["Content-Type"] = "application/json"
+            body = codec.dumps(json)
+
+        async with self._rest_limiter:
+            start = time.perf_counter()
+
+            for attempt in range(REST_MAX_RETRIES + 1):
+                try:
+                    resp = await self._session.request(
+                        method,
+                        f"{self._rest_uri}{path}",
+                        headers=headers,
+                        params=params,
+                        data=body
+                    )
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self._breaker.record_failure()
+                    metrics.REST_REQUESTS.inc(self._identifier, path, "error")
+                    raise
+
+                async with resp:
+                    if resp.status not in REST_RETRY_STATUSES or attempt == REST_MAX_RETRIES:
+                        if resp.status >= 500:
+                            self._breaker.record_failure()
+                        else:
+                            self._breaker.record_success()
+
+                        data = codec.loads(await resp.read()) if resp.status == 200 else None
+
+                        duration = time.perf_counter() - start
+                        metrics.REST_REQUESTS.inc(self._identifier, path, str(resp.status))
+                        metrics.REST_LATENCY.observe(duration, self._identifier, path)
+
+                        if self._recorder:
+                            self._recorder.record_rest(
+                                self._identifier, method, path, params, resp.status, data, duration
+                            )
+                        return resp.status, data
+
+                    delay = backoff.delay()
+                    try:
+                        delay = max(delay, float(resp.headers.get("Retry-After", 0)))
+                    except ValueError:
+                        pass
+
+                await asyncio.sleep(delay)
 
     def get_player(self, guild_id: int):
         """Takes a guild ID as a parameter. Returns a pomice Player object."""
@@ -223,13 +604,58 @@ class Node:
         """Initiates a connection with a Lavalink node and adds it to the node pool."""
         await self._bot.wait_until_ready()
 
+        if self._state is NodeState.ready and self.is_connected:
+            return self
+
+        self._set_state(NodeState.connecting)
+        try:
+            await self._open_websocket()
+        except Exception:
+            self._set_state(NodeState.disconnected)
+            raise
+
+        if not self._task or self._task.done():
+            self._task = self._bot.loop.create_task(self._supervise())
+        if not self._latency_task or self._latency_task.done():
+            self._latency_task = self._bot.loop.create_task(self._sample_latency())
+        if not self._health_task or self._health_task.done():
+            self._health_task = self._bot.loop.create_task(self._check_health())
+
+        return self
+
+    async def _open_websocket(self):
+        headers = self._headers
+        if self._resumable:
+            headers = {**self._headers, "Resume-Key": self._resume_key}
+
         try:
             self._websocket = await self._session.ws_connect(
-                self._websocket_uri, headers=self._headers, heartbeat=self._heartbeat
+                self._websocket_uri, headers=headers, heartbeat=self._heartbeat
             )
-            self._task = self._bot.loop.create_task(self._listen())
+            resumed = self._websocket._response.headers.get("Session-Resumed") == "true"
+
+            if self._resume_key:
+                await self._send_payload(self._pool._codec.dumps({
+                    "op": "configureResuming",
+                    "key": self._resume_key,
+                    "timeout": self._resume_timeout
+                }))
+                self._resumable = True
+
+            if resumed:
+                # Ops sent while the node is still unavailable keep being buffered behind these,
+                # so everything reaches the node in the order it was sent
+                while self._buffer:
+                    await self._send_payload(self._pool._codec.dumps(self._buffer.popleft()))
+            else:
+                self._buffer.clear()
+
+            self._pipeline.start()
+            self._outbound.start()
             self._available = True
-            return self
+            self._set_state(NodeState.ready)
+
+            await self._restore_session(resumed)
 
         except aiohttp.ClientConnectorError:
             raise NodeConnectionFailure(
@@ -248,13 +674,38 @@ class Node:
         """Disconnects a connected Lavalink node and removes it from the node pool.
            This also destroys any players connected to the node.
         """
-        for player in self.players.copy().values():
-            await player.destroy()
+        self._set_state(NodeState.draining)
+
+        # Stop reconnecting first, so a lost connection stays lost while we drain
+        for task in (self._task, self._failover_task, self._latency_task, self._health_task):
+            if task:
+                task.cancel()
 
-        await self._websocket.close()
-        del self._pool.nodes[self._identifier]
-        self.available = False
-        self._task.cancel()
+        try:
+            for player in self.players.copy().values():
+                try:
+                    await player.destroy()
+                except NodeNotAvailable:
+                    # The player has already been dropped locally,
+                    # there's just no connection to tell the node about it
+                    pass
+
+            if self._available:
+                await self._outbound.flush()
+        finally:
+            self._outbound.stop()
+            self._pipeline.stop()
+            self._resumable = False
+            self._available = False
+            self._buffer.clear()
+
+            if self._websocket and not self._websocket.closed:
+                await self._websocket.close()
+
+            self._pool._nodes.pop(self._identifier, None)
+            self._pool._ring.remove(self._identifier)
+            self._pool._update_load_ranking(self)
+            self._set_state(NodeState.disconnected)
 
     async def build_track(
         self,
@@ -264,22 +715,145 @@ class Node:
         """
         Builds a track using a valid track identifier
 
+        The identifier is decoded locally when possible, and only sent to
+        the node if it uses a format the local decoder doesn't understand.
+
         You can also pass in a discord.py Context object to get a
         Context object on the track it builds.
         """
+        try:
+            track = Track(track_id=identifier, ctx=ctx, info=decode_track(identifier))
+            metrics.TRACKS_BUILT.inc(self._identifier, "local")
+            return track
+        except TrackLoadError:
+            pass
+
+        status, data = await self._request("GET", "/decodetrack", params={"track": identifier})
+        if status != 200:
+            raise TrackLoadError(
+                f"Failed to build track. Check if the identifier is correct and try again."
+            )
 
-        async with self._session.get(
-            f"{self._rest_uri}/decodetrack?",
-            headers={"Authorization": self._password},
-            params={"track": identifier}
-        ) as resp:
-            if not resp.status == 200:
-                raise TrackLoadError(
-                    f"Failed to build track. Check if the identifier is correct and try again."
-                )
+        metrics.TRACKS_BUILT.inc(self._identifier, "rest")
+        return Track(track_id=identifier, ctx=ctx, info=data)
+
+    async def build_tracks(
+        self,
+        identifiers: List[str],
+        *,
+        ctx: Optional[commands.Context] = None,
+        chunk_size: int = 100,
+        concurrency: int = 4
+    ) -> List[Union[Track, TrackLoadError]]:
+        """
+        Builds multiple tracks using valid track identifiers with the bulk decode endpoint.
+
+        Identifiers are decoded locally when possible. The rest are sent in chunks of `chunk_size`,
+        with at most `concurrency` requests in flight at once.
+        Results are returned in the same order as the identifiers. If an identifier
+        could not be decoded, its position holds the TrackLoadError instead.
+
+        You can also pass in a discord.py Context object to get a
+        Context object on the tracks it builds.
+        """
+        results: List[Union[Track, TrackLoadError]] = [None] * len(identifiers)
+        pending: List[int] = []
+
+        for index, identifier in enumerate(identifiers):
+            try:
+                results[index] = Track(track_id=identifier, ctx=ctx, info=decode_track(identifier))
+            except TrackLoadError:
+                pending.append(index)
+
+        metrics.TRACKS_BUILT.inc(self._identifier, "local", amount=len(identifiers) - len(pending))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def decode_chunk(indexes: List[int]):
+            chunk = [identifiers[index] for index in indexes]
+
+            async with semaphore:
+                try:
+                    status, data = await self._request("POST", "/decodetracks", json=chunk)
+                except (aiohttp.ClientError, asyncio.TimeoutError, NodeRestException) as exc:
+                    # The node couldn't be reached, so every identifier in this chunk failed,
+                    # but the other chunks can still succeed
+                    error = TrackLoadError(f"Failed to build track. [{exc.__class__.__name__}]")
+                    for index in indexes:
+                        results[index] = error
+                    return
+
+                if data is not None and len(data) == len(chunk):
+                    for index, identifier, item in zip(indexes, chunk, data):
+                        results[index] = Track(track_id=identifier, ctx=ctx, info=item["info"])
+
+                    metrics.TRACKS_BUILT.inc(self._identifier, "rest", amount=len(chunk))
+                    return
+
+                if status != 400 and data is None:
+                    # The node is throttling or failing, so decoding this chunk one by one
+                    # would only pile more requests on it
+                    error = TrackLoadError(f"Failed to build track. [{status}]")
+                    for index in indexes:
+                        results[index] = error
+                    return
+
+                # Lavalink fails the whole request if any identifier is invalid,
+                # so decode this chunk one by one to find out which ones are bad
+                for index, identifier in zip(indexes, chunk):
+                    try:
+                        results[index] = await self.build_track(identifier, ctx=ctx)
+                    except TrackLoadError as exc:
+                        results[index] = exc
+                    except (aiohttp.ClientError, asyncio.TimeoutError, NodeRestException) as exc:
+                        results[index] = TrackLoadError(
+                            f"Failed to build track. [{exc.__class__.__name__}]"
+                        )
+
+        await asyncio.gather(
+            *(
+                decode_chunk(pending[start:start + chunk_size])
+                for start in range(0, len(pending), chunk_size)
+            )
+        )
+        return results
+
+    async def _fetch_tracks(self, query: str) -> dict:
+        status, data = await self._request("GET", "/loadtracks", params={"identifier": query})
+        if status != 200:
+            raise TrackLoadError(
+                f"There was an error while trying to load this track. [{status}]"
+            )
+
+        return data
+
+    async def _fetch_or_cache_tracks(self, query: str, key: str) -> dict:
+        cache: Optional[TrackCache] = self._pool._track_cache
+        if cache is None:
+            return await self._fetch_tracks(query)
+
+        return await cache.fetch(key, lambda: self._fetch_tracks(query))
 
-            data: dict = await resp.json()
-            return Track(track_id=identifier, ctx=ctx, info=data)
+    async def _load_tracks(self, query: str) -> dict:
+        # Concurrent loads of the same query share a single request. The request runs in its own
+        # task so one caller being cancelled doesn't cancel it for everyone else waiting on it.
+        key = normalize_query(query)
+        cache: Optional[TrackCache] = self._pool._track_cache
+        # Fresh cache hits don't need a task at all
+        if cache is not None and (data := cache.get(key)) is not None:
+            return data
+
+        inflight = self._pool._inflight_loads
+        if (task := inflight.get(key)) is None:
+            task = self._bot.loop.create_task(self._fetch_or_cache_tracks(query, key))
+            inflight[key] = task
+
+            def _done(finished: asyncio.Task):
+                if inflight.get(key) is finished:
+                    del inflight[key]
+
+            task.add_done_callback(_done)
+
+        return await asyncio.shield(task)
 
     async def get_tracks(
         self,
@@ -295,12 +869,37 @@ class Node:
 
            You can also pass in a discord.py Context object to get a
            Context object on any track you search.
+
+           If a track cache has been set on the pool, results will be served from it when possible.
+           Concurrent searches for the same query are coalesced into a single request,
+           but every caller still gets their own Track objects.
         """
+        source = "spotify" if SPOTIFY_URL_REGEX.match(query) else "lavalink"
+        start = time.perf_counter()
+        try:
+            with tracing.span("pomice.node.get_tracks", node=self._identifier):
+                return await self._get_tracks(query, ctx=ctx, search_type=search_type)
+        finally:
+            metrics.TRACK_LOADS.observe(time.perf_counter() - start, self._identifier, source)
 
-        if not URL_REGEX.match(query) and not re.match(r"(?:ytm?|sc)search:.", query):
-            query = f"{search_type}:{query}"
+    async def _get_tracks(
+        self,
+        query: str,
+        *,
+        ctx: Optional[commands.Context] = None,
+        search_type: SearchType = SearchType.ytsearch
+    ):
+        with tracing.span("pomice.node.classify_query") as span:
+            if not URL_REGEX.match(query) and not re.match(r"(?:ytm?|sc)search:.", query):
+                query = f"{search_type}:{query}"
+
+            spotify_url = SPOTIFY_URL_REGEX.match(query)
+            discord_url = None if spotify_url else DISCORD_MP3_URL_REGEX.match(query)
+            span.set_attribute(
+                "kind", "spotify" if spotify_url else "discord" if discord_url else "lavalink"
+            )
 
-        if SPOTIFY_URL_REGEX.match(query):
+        if spotify_url:
             if not self._spotify_client_id and not self._spotify_client_secret:
                 raise InvalidSpotifyClientAuthorization(
                     "You did not provide proper Spotify client authorization credentials. "
@@ -308,7 +907,8 @@ class Node:
                     "please obtain Spotify API credentials here: https://developer.spotify.com/"
                 )
 
-            spotify_results = await self._spotify_client.search(query=query)
+            with tracing.span("pomice.spotify.search", query=query):
+                spotify_results = await self._spotify_client.search(query=query)
 
             if isinstance(spotify_results, spotify.Track):
                 return [
@@ -363,12 +963,9 @@ class Node:
                 spotify_playlist=spotify_results
             )
 
-        elif discord_url := DISCORD_MP3_URL_REGEX.match(query):
-            async with self._session.get(
-                url=f"{self._rest_uri}/loadtracks?identifier={quote(query)}",
-                headers={"Authorization": self._password}
-            ) as response:
-                data: dict = await response.json()
+        elif discord_url:
+            with tracing.span("pomice.node.load_tracks", node=self._identifier, query=query):
+                data: dict = await self._load_tracks(query)
 
             track: dict = data["tracks"][0]
             info: dict = track.get("info")
@@ -389,12 +986,8 @@ class Node:
             ]
 
         else:
-            async with self._session.get(
-                url=f"{self._rest_uri}/loadtracks?identifier={quote(query)}",
-                headers={"Authorization": self._password}
-            ) as response:
-                data = await response.json()
-
+            with tracing.span("pomice.node.load_tracks", node=self._identifier, query=query):
+                data = await self._load_tracks(query)
 
         load_type = data.get("loadType")
 
@@ -434,6 +1027,25 @@ class NodePool:
     """
 
     _nodes = {}
+    _least_loaded_node: Optional[Node] = None
+    _players: Dict[int, Player] = {}
+    _dispatchers: Dict[int, Any] = {}
+    _ring = HashRing()
+    _default_algorithm: Optional[NodeAlgorithm] = None
+    _track_cache: Optional[TrackCache] = None
+    _resolution_cache: Optional[ResolutionCache] = None
+    _inflight_loads: Dict[str, asyncio.Task] = {}
+
+    _codec: Codec = OrjsonCodec()
+
+    _session: Optional[aiohttp.ClientSession] = None
+    _http_options = {
+        "limit": 100,
+        "limit_per_host": 30,
+        "keepalive_timeout": 60,
+        "ttl_dns_cache": 300,
+    }
+    _spotify_clients: Dict[Tuple[str, str], spotify.Client] = {}
 
     def __repr__(self):
         return f"<Pomice.NodePool node_count={self.node_count}>"
@@ -447,55 +1059,276 @@ class NodePool:
     def node_count(self):
         return len(self._nodes.values())
 
+    @property
+    def track_cache(self) -> Optional[TrackCache]:
+        """Property which returns the track cache shared by all nodes, if one is set."""
+        return self._track_cache
+
+    @property
+    def resolution_cache(self) -> Optional[ResolutionCache]:
+        """Property which returns the Spotify track resolution cache used by all players,
+           if one is set.
+        """
+        return self._resolution_cache
+
+    @classmethod
+    def configure_http(
+        cls,
+        *,
+        limit: int = 100,
+        limit_per_host: int = 30,
+        keepalive_timeout: float = 60,
+        ttl_dns_cache: int = 300
+    ) -> None:
+        """Configures the connection pool of the HTTP session shared by all nodes
+           and Spotify clients. This must be called before any nodes are created.
+        """
+        if cls._session and not cls._session.closed:
+            raise NodeException("The shared HTTP session has already been created.")
+
+        cls._http_options = {
+            "limit": limit,
+            "limit_per_host": limit_per_host,
+            "keepalive_timeout": keepalive_timeout,
+            "ttl_dns_cache": ttl_dns_cache,
+        }
+
+    @classmethod
+    def _get_session(cls) -> aiohttp.ClientSession:
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(**cls._http_options)
+            cls._session = aiohttp.ClientSession(connector=connector)
+
+        return cls._session
+
+    @classmethod
+    def _get_spotify_client(cls, client_id: str, client_secret: str) -> spotify.Client:
+        key = (client_id, client_secret)
+        client = cls._spotify_clients.get(key)
+
+        if client is None or client.session.closed:
+            client = spotify.Client(client_id, client_secret, session=cls._get_session())
+            cls._spotify_clients[key] = client
+
+        return client
+
+    @classmethod
+    async def close(cls) -> None:
+        """Disconnects every node in the pool and closes the shared HTTP session."""
+        for node in list(cls._nodes.values()):
+            await node.disconnect()
+
+        for client in cls._spotify_clients.values():
+            await client.close()
+        cls._spotify_clients.clear()
+
+        if cls._session and not cls._session.closed:
+            await cls._session.close()
+        cls._session = None
+
     @classmethod
-    def get_best_node(cls, *, algorithm: NodeAlgorithm) -> Node:
+    def set_default_algorithm(cls, algorithm: Optional[NodeAlgorithm]) -> None:
+        """Sets the algorithm used to choose a node for players created without one.
+           Pass in None to choose a node at random, which is the default.
+        """
+        cls._default_algorithm = algorithm
+
+    @classmethod
+    def set_codec(cls, codec: Codec) -> None:
+        """Sets the codec used to encode and decode all traffic to and from nodes.
+           The default codec uses orjson.
+        """
+        cls._codec = codec
+
+    @classmethod
+    def set_track_cache(cls, cache: Optional[TrackCache]) -> None:
+        """Sets the track cache shared by all nodes in the pool.
+           Pass in None to disable caching.
+        """
+        cls._track_cache = cache
+
+    @classmethod
+    def set_resolution_cache(cls, cache: Optional[ResolutionCache]) -> None:
+        """Sets the cache players check before searching for the Lavalink equivalent
+           of a Spotify track. Pass in None to disable it.
+        """
+        cls._resolution_cache = cache
+
+    @property
+    def players(self) -> Dict[int, Player]:
+        """Property which returns a dict containing the guild ID and the player object
+           for every player across all nodes.
+        """
+        return self._players
+
+    @classmethod
+    def _register_dispatcher(cls, bot: Client) -> None:
+        # A single listener per bot routes voice events to players for every node,
+        # instead of each node filtering every gateway event on its own.
+        if id(bot) in cls._dispatchers:
+            return
+
+        async def dispatcher(data: dict):
+            if not data or data.get("t") not in VOICE_EVENTS:
+                return
+
+            await cls._dispatch_voice_event(bot, data["t"], data["d"])
+
+        cls._dispatchers[id(bot)] = dispatcher
+        bot.add_listener(dispatcher, "on_socket_response")
+
+    @classmethod
+    async def _dispatch_voice_event(cls, bot: Client, event: str, data: dict) -> None:
+        if not (player := cls._players.get(int(data["guild_id"]))):
+            return
+
+        if event == "VOICE_SERVER_UPDATE":
+            await player.on_voice_server_update(data)
+        elif int(data["user_id"]) == bot.user.id:
+            await player.on_voice_state_update(data)
+
+    @classmethod
+    def get_best_node(
+        cls,
+        *,
+        algorithm: NodeAlgorithm,
+        region: Optional[str] = None,
+        guild_id: Optional[int] = None,
+        shard_id: Optional[int] = None
+    ) -> Node:
         """Fetches the best node based on an NodeAlgorithm.
          This option is preferred if you want to choose the best node
          from a multi-node setup using either the node's latency
          or the node's voice region.
 
          Use NodeAlgorithm.by_ping if you want to get the best node
-         based on the node's latency.
+         based on the node's latency. Latency is sampled in the background,
+         so this never blocks.
 
          Use NodeAlgorithm.by_region if you want to get the best node
          based on the node's voice region. This method will only work
-         if you set a voice region when you create a node.
+         if you set a voice region when you create a node. Pass in the region
+         to match, such as Player.region. Nodes in that region are preferred,
+         and the node with the lowest latency is chosen among them.
+         If no nodes are in that region, the node with the lowest latency is chosen.
 
          Use NodeAlgorithm.by_players if you want to get the best node
          based on how players it has. This method will return a node with
          the least amount of players
+
+         Use NodeAlgorithm.by_load if you want to get the best node
+         based on the load reported in its stats. The ranking is kept up to date
+         as stats arrive, so this is a constant-time lookup.
+
+         Use NodeAlgorithm.by_guild if you want a guild to keep landing on the same node.
+         Pass in the guild ID, or a shard ID to keep every guild of a shard on the same node.
+         If the preferred node is unavailable, the next node on the hash ring is chosen.
+
+         Nodes which are recovering from failed health checks are only chosen
+         if there are no healthy nodes.
         """
-        available_nodes = [node for node in cls._nodes.values() if node._available]
+        available_nodes = cls._available_nodes()
 
         if not available_nodes:
             raise NoNodesAvailable("There are no nodes available.")
 
         if algorithm == NodeAlgorithm.by_ping:
-            tested_nodes = {node: node.latency for node in available_nodes}
-            return min(tested_nodes, key=tested_nodes.get)
+            return min(available_nodes, key=lambda node: (node.latency, node.jitter))
+
+        elif algorithm == NodeAlgorithm.by_region:
+            if region:
+                region = region.lower()
+                local_nodes = [node for node in available_nodes if node._in_region(region)]
+                available_nodes = local_nodes or available_nodes
+
+            return min(available_nodes, key=lambda node: (node.latency, node.jitter))
 
         elif algorithm == NodeAlgorithm.by_players:
             tested_nodes = {node: len(node.players.keys()) for node in available_nodes}
             return min(tested_nodes, key=tested_nodes.get)
-    
+
+        elif algorithm == NodeAlgorithm.by_guild:
+            if shard_id is not None:
+                key = f"shard:{shard_id}"
+            elif guild_id is not None:
+                key = f"guild:{guild_id}"
+            else:
+                raise ValueError("A guild ID or shard ID is required for NodeAlgorithm.by_guild.")
+
+            for identifier in cls._ring.iter_nodes(key):
+                node = cls._nodes.get(identifier)
+                if node in available_nodes:
+                    return node
+
+            return available_nodes[0]
+
+        elif algorithm == NodeAlgorithm.by_load:
+            best = cls._least_loaded_node
+            if best is None or best not in available_nodes:
+                best = cls._rank_by_load()
+
+            return best
+
+    @classmethod
+    def _available_nodes(cls) -> List[Node]:
+        available_nodes = [node for node in cls._nodes.values() if node.is_available]
+        healthy_nodes = [
+            node for node in available_nodes if node.circuit_state is CircuitState.closed
+        ]
+        return healthy_nodes or available_nodes
+
+    @classmethod
+    def _rank_by_load(cls) -> Optional[Node]:
+        available_nodes = cls._available_nodes()
+        cls._least_loaded_node = min(
+            available_nodes, key=lambda node: node.penalty, default=None
+        )
+        return cls._least_loaded_node
+
+    @classmethod
+    def _update_load_ranking(cls, node: Node):
+        best = cls._least_loaded_node
+
+        # Only a full re-rank is needed when the current best node got worse or went away,
+        # otherwise the updated node just has to beat the current best.
+        if best is None or best is node or not best.is_available:
+            cls._rank_by_load()
+        elif node.is_available and node.penalty < best.penalty:
+            cls._least_loaded_node = node
+
+
+    @classmethod
+    async def _failover(cls, node: Node):
+        """Moves every player on a node that has been lost to another available node,
+           chosen the same way as for new players.
+        """
+        async def move(player: Player):
+            try:
+                await player.change_node(player._choose_node())
+            except NoNodesAvailable:
+                return
+            except Exception as exc:
+                node._bot.dispatch("pomice_failover_error", player, exc)
+
+        players = list(node._players.values())
+        if players:
+            await asyncio.gather(*(move(player) for player in players))
 
     @classmethod
     def get_node(cls, *, identifier: str = None) -> Node:
         """Fetches a node from the node pool using it's identifier.
            If no identifier is provided, it will choose a node at random.
         """
-        available_nodes = {
-            identifier: node
-            for identifier, node in cls._nodes.items() if node._available
-        }
+        available_nodes = cls._available_nodes()
 
         if not available_nodes:
             raise NoNodesAvailable("There are no nodes available.")
 
         if identifier is None:
-            return random.choice(list(available_nodes.values()))
+            return random.choice(available_nodes)
 
-        return available_nodes.get(identifier, None)
+        node = cls._nodes.get(identifier, None)
+        return node if node and node.is_available else None
 
     @classmethod
     async def create_node(
@@ -511,10 +1344,20 @@ class NodePool:
         spotify_client_id: Optional[str] = None,
         spotify_client_secret: Optional[str] = None,
         session: Optional[aiohttp.ClientSession] = None,
+        resume_key: Optional[str] = None,
+        resume_timeout: int = 60,
+        resume_buffer_size: int = 100,
+        rest_concurrency: int = 16,
+        rest_queue_size: int = 256,
+        region: Optional[str] = None,
+        recorder: Optional[TrafficRecorder] = None,
 
     ) -> Node:
         """Creates a Node object to be then added into the node pool.
            For Spotify searching capabilites, pass in valid Spotify API credentials.
+           For session resuming across reconnects, pass in a resume key.
+           For region-aware node selection, pass in the voice region the node is hosted in.
+           To record the node's traffic, pass in a TrafficRecorder.
         """
         if identifier in cls._nodes.keys():
             raise NodeCreationError(f"A node with identifier '{identifier}' already exists.")
@@ -523,9 +1366,13 @@ class NodePool:
             pool=cls, bot=bot, host=host, port=port, password=password,
             identifier=identifier, secure=secure, heartbeat=heartbeat,
             spotify_client_id=spotify_client_id, 
-            session=session, spotify_client_secret=spotify_client_secret
+            session=session, spotify_client_secret=spotify_client_secret,
+            resume_key=resume_key, resume_timeout=resume_timeout,
+            resume_buffer_size=resume_buffer_size, rest_concurrency=rest_concurrency,
+            rest_queue_size=rest_queue_size, region=region, recorder=recorder
         )
 
         await node.connect()
         cls._nodes[node._identifier] = node
+        cls._ring.add(node._identifier)
         return node
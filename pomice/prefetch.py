@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from .objects import Track
+from .queue import Queue
+
+if TYPE_CHECKING:
+    from .player import Player
+
+__all__ = [
+    "Prefetcher",
+]
+
+log = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Finds the Lavalink equivalents of the next Spotify tracks in a queue in the background,
+       so playing them only needs a single op to be sent.
+       Use `Player.enable_prefetch()` to create one.
+
+       The upcoming tracks are checked again every time the queue changes.
+       Lookups for tracks which are no longer among the next `depth` tracks are cancelled.
+    """
+
+    def __init__(self, player: Player, queue: Queue, *, depth: int = 2) -> None:
+        self._player = player
+        self._queue = queue
+        self._depth = depth
+
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._claimed: Set[int] = set()
+        self._refresh_handle: Optional[asyncio.Handle] = None
+        self._refreshed_version: Optional[int] = None
+        self._running = False
+
+        self.resolved: int = 0
+        self.failed: int = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.Prefetcher depth={self._depth} pending={len(self._pending)} "
+            f"resolved={self.resolved}>"
+        )
+
+    @property
+    def queue(self) -> Queue:
+        """Returns the queue being prefetched from."""
+        return self._queue
+
+    @property
+    def depth(self) -> int:
+        """Returns how many upcoming tracks are prefetched."""
+        return self._depth
+
+    def start(self) -> None:
+        """Starts prefetching. This does nothing if it's already running."""
+        if self._running:
+            return
+
+        self._running = True
+        self._queue.add_listener(self._on_change)
+        self._schedule_refresh()
+
+    def stop(self) -> None:
+        """Stops prefetching and cancels any lookups in progress."""
+        if not self._running:
+            return
+
+        self._running = False
+        self._queue.remove_listener(self._on_change)
+        if self._refresh_handle:
+            self._refresh_handle.cancel()
+            self._refresh_handle = None
+
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def wait_for(self, track: Track) -> Optional[Track]:
+        """Waits for the lookup of a track if one is in progress and returns its result.
+           Returns None if the track isn't being looked up or the lookup failed.
+        """
+        if not (task := self._pending.get(id(track))):
+            return None
+
+        # The track is usually taken out of the queue right before it's played,
+        # so make sure its lookup isn't cancelled while we wait for it
+        self._claimed.add(id(track))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        finally:
+            self._claimed.discard(id(track))
+
+    def _on_change(self, queue: Queue) -> None:
+        # A burst of changes, such as extending the queue, only refreshes once
+        self._schedule_refresh()
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_handle is None:
+            self._refresh_handle = asyncio.get_running_loop().call_soon(self._refresh)
+
+    def _refresh(self) -> None:
+        self._refresh_handle = None
+        if not self._running or self._refreshed_version == self._queue.version:
+            return
+
+        self._refreshed_version = self._queue.version
+        upcoming: List[Track] = [
+            track for track in self._queue.upcoming(self._depth)
+            if track.spotify and track.original is None
+        ]
+        wanted = {id(track) for track in upcoming}
+
+        for key in [key for key in self._pending if key not in wanted and key not in self._claimed]:
+            self._pending.pop(key).cancel()
+
+        for track in upcoming:
+            if id(track) not in self._pending:
+                self._pending[id(track)] = asyncio.get_running_loop().create_task(
+                    self._resolve(track)
+                )
+
+    async def _resolve(self, track: Track) -> Optional[Track]:
+        try:
+            track.original = await self._player._resolve_track(track)
+            self.resolved += 1
+            return track.original
+        except Exception:
+            # Playing the track will try again and raise the error if it still fails
+            self.failed += 1
+            log.debug("Failed to prefetch %r", track, exc_info=True)
+            return None
+        finally:
+            if self._pending.get(id(track)) is asyncio.current_task():
+                del self._pending[id(track)]
@@ -4,6 +4,7 @@ from collections import deque
 from copy import copy
 from re import L
 from typing import (
+    Callable,
     Iterable,
     Iterator,
     List,
@@ -28,6 +29,8 @@ class Queue(Iterable[Track]):
         self._overflow: bool = overflow
         self._loop_mode: Optional[LoopMode] = None
         self._current_item: Optional[Track] = None
+        self._version: int = 0
+        self._listeners: List[Callable[[Queue], None]] = []
 
     def __str__(self) -> str:
         """String showing all Track objects appearing as a list."""
@@ -70,6 +73,7 @@ class Queue(Iterable[Track]):
     def __delitem__(self, index: int) -> None:
         """Delete item at given position."""
         self._queue.__delitem__(index)
+        self._changed()
 
     def __iter__(self) -> Iterator[Track]:
         """Iterate over members in the queue.
@@ -112,7 +116,9 @@ class Queue(Iterable[Track]):
         return self._queue.pop(0)
 
     def _drop(self) -> Track:
-        return self._queue.pop()
+        item = self._queue.pop()
+        self._changed()
+        return item
 
     def _index(self, item: Track) -> int:
         return self._queue.index(item)
@@ -120,12 +126,20 @@ class Queue(Iterable[Track]):
 
     def _put(self, item: Track) -> None:
         self._queue.append(item)
+        self._changed()
 
     def _insert(self, index: int, item: Track) -> None:
         self._queue.insert(index, item)
+        self._changed()
 
     def _remove(self, index: int) -> None:
-        self._queue.remove(index)
+        del self._queue[index]
+        self._changed()
+
+    def _changed(self) -> None:
+        self._version += 1
+        for listener in self._listeners:
+            listener(self)
 
     def _get_random_float(self) -> float:
         return random.random()
@@ -175,6 +189,35 @@ class Queue(Iterable[Track]):
         """Returns the amount of items in the queue"""
         return len(self._queue)
 
+    @property
+    def version(self) -> int:
+        """Returns a number which goes up every time the queue changes"""
+        return self._version
+
+    def add_listener(self, listener: Callable[[Queue], None]) -> None:
+        """Adds a function which is called with the queue every time it changes,
+        including when an item is taken out of it with `get()`.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Queue], None]) -> None:
+        """Removes a function added with `add_listener()`."""
+        self._listeners.remove(listener)
+
+    def upcoming(self, count: int) -> List[Track]:
+        """Returns the next `count` items `get()` will return, taking the loop mode into account.
+        Does not remove items from the queue.
+        """
+        if self._loop_mode == LoopMode.TRACK:
+            return [self._current_item] if self._current_item else []
+
+        if self._loop_mode == LoopMode.QUEUE and self._current_item in self._queue:
+            start = self._index(self._current_item) + 1
+            count = min(count, len(self._queue))
+            return [self._queue[(start + offset) % len(self._queue)] for offset in range(count)]
+
+        return self._queue[:count]
+
 
 
     def get_queue(self) -> List:
@@ -216,6 +259,7 @@ class Queue(Iterable[Track]):
             item = self._get()
 
         self._current_item = item
+        self._changed()
         return item
 
     def pop(self) -> Track:
@@ -225,7 +269,9 @@ class Queue(Iterable[Track]):
         if self.is_empty:
             raise QueueEmpty("No items in the queue.")
 
-        return self._queue.pop()
+        item = self._queue.pop()
+        self._changed()
+        return item
 
     def remove(self, item: Track) -> None:
         """
@@ -297,6 +343,7 @@ class Queue(Iterable[Track]):
     def clear(self) -> None:
         """Remove all items from the queue."""
         self._queue.clear()
+        self._changed()
 
     def set_loop_mode(self, mode: LoopMode):
         """
@@ -312,6 +359,8 @@ class Queue(Iterable[Track]):
             if self._current_item not in self._queue:
                 self._queue.insert(index, self._current_item)
             self._current_item = self._queue[index]
+
+        self._changed()
             
 
     def disable_loop(self):
@@ -327,8 +376,10 @@ class Queue(Iterable[Track]):
             self._queue = self._queue[index:]
 
         self._loop_mode = None
+        self._changed()
         
 
     def shuffle(self):
         """Shuffles the queue."""
-        return random.shuffle(self._queue)
\ No newline at end of file
+        random.shuffle(self._queue)
+        self._changed()
\ No newline at end of file
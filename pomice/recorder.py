@@ -0,0 +1,288 @@
+"""Recording and replaying of node traffic.
+
+A `TrafficRecorder` passed to a node writes every inbound frame, outbound op and REST exchange
+to an append-only file, one JSON record per line. A `TrafficReplayer` reads those files back
+and feeds the recorded frames through a node, so incidents can be reproduced and profiled.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Iterator, List, Optional, Sequence, Union
+
+import orjson
+
+__all__ = [
+    "TrafficRecord",
+    "TrafficRecorder",
+    "TrafficReplayer",
+]
+
+log = logging.getLogger(__name__)
+
+INBOUND = "in"
+OUTBOUND = "out"
+REST = "rest"
+
+
+class TrafficRecord:
+    """A single recorded frame, op or REST exchange.
+       For REST exchanges, `data` is a dict with the method, path, params, status, body
+       and duration in milliseconds.
+    """
+
+    __slots__ = ("timestamp", "kind", "node", "data")
+
+    def __init__(self, timestamp: float, kind: str, node: str, data: Any) -> None:
+        self.timestamp = timestamp
+        self.kind = kind
+        self.node = node
+        self.data = data
+
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.TrafficRecord kind={self.kind!r} node={self.node!r} "
+            f"timestamp={self.timestamp}>"
+        )
+
+
+class TrafficRecorder:
+    """Records node traffic to a file, one JSON record per line.
+       Pass an instance to `NodePool.create_node()` to record that node's traffic.
+       One recorder can be shared by several nodes, as every record holds the node's identifier.
+
+       Once the file reaches `max_bytes`, it is renamed to `path.1` (and so on, up to
+       `backup_count` files) and a new one is started. Writes are buffered,
+       so call `close()` or `flush()` before reading a capture that's still being recorded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_bytes: int = 64 * 1024 * 1024,
+        backup_count: int = 5
+    ) -> None:
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+        self.records: int = 0
+
+    def __repr__(self) -> str:
+        return f"<Pomice.TrafficRecorder path={self._path!r} records={self.records}>"
+
+    @property
+    def path(self) -> str:
+        """Returns the path of the file currently being written to."""
+        return self._path
+
+    @property
+    def closed(self) -> bool:
+        """Returns whether the recorder has been closed."""
+        return self._file.closed
+
+    def record_inbound(self, node: str, payload: Union[str, bytes]) -> None:
+        """Records a frame received from a node, as the raw JSON it was received as.
+           Frames which aren't valid JSON are recorded as a string holding the frame.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        try:
+            data = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            payload = orjson.dumps(payload.decode(errors="replace"))
+        else:
+            # Every record has to fit on a single line
+            if b"\n" in payload or b"\r" in payload:
+                payload = orjson.dumps(data)
+
+        self._write(INBOUND, node, payload)
+
+    def record_outbound(self, node: str, payload: bytes) -> None:
+        """Records an op sent to a node, as the encoded JSON it was sent as."""
+        self._write(OUTBOUND, node, payload)
+
+    def record_rest(
+        self,
+        node: str,
+        method: str,
+        path: str,
+        params: Optional[dict],
+        status: int,
+        body: Any,
+        duration: float
+    ) -> None:
+        """Records a REST exchange with a node. The duration is in seconds."""
+        self._write(REST, node, orjson.dumps({
+            "method": method,
+            "path": path,
+            "params": params,
+            "status": status,
+            "body": body,
+            "ms": round(duration * 1000, 3)
+        }))
+
+    def _write(self, kind: str, node: str, payload: bytes) -> None:
+        if self._file.closed:
+            return
+
+        # The payload is already JSON, so it's spliced in rather than decoded and encoded again
+        line = b'{"t":%.6f,"k":"%s","n":%s,"p":%s}\n' % (
+            time.time(), kind.encode(), orjson.dumps(node), payload
+        )
+        self._file.write(line)
+        self._size += len(line)
+        self.records += 1
+
+        if self._size >= self._max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        self._file.close()
+
+        if self._backup_count:
+            for index in range(self._backup_count - 1, 0, -1):
+                source = f"{self._path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self._path}.{index + 1}")
+
+            os.replace(self._path, f"{self._path}.1")
+            self._file = open(self._path, "ab")
+        else:
+            self._file = open(self._path, "wb")
+
+        self._size = 0
+
+    def flush(self) -> None:
+        """Writes any buffered records to the file."""
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Flushes and closes the file. Anything recorded afterwards is discarded."""
+        self._file.close()
+
+
+class TrafficReplayer:
+    """Reads captures written by a `TrafficRecorder` and replays them through a node.
+       If the capture was rotated, pass in its files from oldest to newest,
+       or use `TrafficReplayer.from_rotated()` to find them.
+    """
+
+    def __init__(self, paths: Union[str, Sequence[str]]) -> None:
+        self._paths: List[str] = [paths] if isinstance(paths, str) else list(paths)
+
+    def __repr__(self) -> str:
+        return f"<Pomice.TrafficReplayer paths={self._paths!r}>"
+
+    @classmethod
+    def from_rotated(cls, path: str) -> "TrafficReplayer":
+        """Creates a replayer for a capture and every rotated file it left behind."""
+        backups = []
+        index = 1
+        while os.path.exists(f"{path}.{index}"):
+            backups.append(f"{path}.{index}")
+            index += 1
+
+        return cls([*reversed(backups), path])
+
+    def records(
+        self,
+        *,
+        kinds: Optional[Sequence[str]] = None,
+        node: Optional[str] = None
+    ) -> Iterator[TrafficRecord]:
+        """Yields every record in order, optionally only those of certain kinds
+           ("in", "out" or "rest") or from a certain node.
+        """
+        for path in self._paths:
+            for raw in self._read(path):
+                if kinds and raw["k"] not in kinds:
+                    continue
+                if node and raw["n"] != node:
+                    continue
+
+                yield TrafficRecord(raw["t"], raw["k"], raw["n"], raw["p"])
+
+    def _read(self, path: str) -> Iterator[dict]:
+        with open(path, "rb") as f:
+            number = 1
+            line = f.readline()
+            while line:
+                next_line = f.readline()
+                try:
+                    raw = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # The last line may be cut short if the recorder didn't close cleanly,
+                    # but anywhere else the capture is corrupt
+                    if next_line:
+                        raise ValueError(f"Line {number} of {path!r} is not a valid record.")
+                    return
+
+                yield raw
+                number += 1
+                line = next_line
+
+    def guild_ids(self, *, node: Optional[str] = None) -> List[int]:
+        """Returns the IDs of every guild that received frames in the capture,
+           i.e: to create players for them before replaying.
+        """
+        guild_ids = {
+            int(record.data["guildId"])
+            for record in self.records(kinds=(INBOUND,), node=node)
+            if isinstance(record.data, dict) and record.data.get("guildId")
+        }
+        return sorted(guild_ids)
+
+    async def replay(
+        self,
+        node,
+        *,
+        speed: Optional[float] = 1.0,
+        source: Optional[str] = None,
+        pipeline: bool = False
+    ) -> int:
+        """Feeds the recorded inbound frames through a node's `_handle_payload`,
+           as if the node had received them. Returns how many frames were replayed.
+
+           Frames are replayed with their original timing, scaled by `speed`.
+           Set `speed` to None to replay them as fast as possible.
+
+           By default, frames from every node in the capture are replayed.
+           Pass in a node's identifier as `source` to only replay frames from that node.
+           Set `pipeline` to True to go through the node's inbound pipeline, like live frames do.
+           Frames which were recorded as invalid JSON are decoded again and skipped if they fail,
+           as they were when received.
+        """
+        handle = node._pipeline.put if pipeline else node._handle_payload
+        codec = node._pool._codec
+        replayed = 0
+        first_recorded = started = None
+
+        for record in self.records(kinds=(INBOUND,), node=source):
+            if speed:
+                if first_recorded is None:
+                    first_recorded, started = record.timestamp, time.perf_counter()
+
+                elapsed = time.perf_counter() - started
+                delay = (record.timestamp - first_recorded) / speed - elapsed
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            data = record.data
+            if isinstance(data, str):
+                try:
+                    data = codec.loads(data)
+                except Exception:
+                    log.exception("Ignoring malformed frame recorded from node '%s'", record.node)
+                    continue
+
+            await handle(data)
+            replayed += 1
+
+        return replayed
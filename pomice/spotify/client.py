@@ -1,11 +1,13 @@
 import re
 import time
 from base64 import b64encode
+from typing import Optional
 
 import aiohttp
 import orjson as json
 
 
+from .. import metrics
 from .exceptions import InvalidSpotifyURL, SpotifyRequestException
 from .objects import * 
 
@@ -20,13 +22,23 @@ class Client:
     """The base client for the Spotify module of Pomice.
        This class will do all the heavy lifting of getting all the metadata 
        for any Spotify URL you throw at it.
+
+       You can pass in an existing aiohttp session to reuse its connections.
+       If you don't, the client creates and owns its own session.
     """
 
-    def __init__(self, client_id: str, client_secret: str) -> None:
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        *,
+        session: Optional[aiohttp.ClientSession] = None
+    ) -> None:
         self._client_id = client_id
         self._client_secret = client_secret
 
-        self.session = aiohttp.ClientSession()
+        self._owns_session = session is None
+        self.session = session or aiohttp.ClientSession()
 
         self._bearer_token: str = None
         self._expiry = 0
@@ -34,6 +46,11 @@ class Client:
         self._grant_headers = {"Authorization": f"Basic {self._auth_token.decode()}"}
         self._bearer_headers = None
 
+    async def close(self) -> None:
+        """Closes the client's session, unless it was passed in when creating the client."""
+        if self._owns_session and not self.session.closed:
+            await self.session.close()
+
     async def _fetch_bearer_token(self) -> None:
         _data = {"grant_type": "client_credentials"}
 
@@ -50,16 +67,29 @@ class Client:
         self._bearer_headers = {"Authorization": f"Bearer {self._bearer_token}"}
 
     async def search(self, *, query: str):
+        result = SPOTIFY_URL_REGEX.match(query)
+        if not result:
+            raise InvalidSpotifyURL("The Spotify link provided is not valid.")
+
+        spotify_type = result.group("type")
+        start = time.perf_counter()
+        status = "error"
+
+        try:
+            results = await self._search(result)
+            status = "ok"
+            return results
+        finally:
+            metrics.SPOTIFY_REQUESTS.inc(spotify_type, status)
+            metrics.SPOTIFY_LATENCY.observe(time.perf_counter() - start, spotify_type)
+
+    async def _search(self, result: re.Match):
         if not self._bearer_token or time.time() >= self._expiry:
             await self._fetch_bearer_token()
 
-        result = SPOTIFY_URL_REGEX.match(query)
         spotify_type = result.group("type")
         spotify_id = result.group("id")
 
-        if not result:
-            raise InvalidSpotifyURL("The Spotify link provided is not valid.")
-
         request_url = REQUEST_URL.format(type=spotify_type, id=spotify_id)
 
         async with self.session.get(request_url, headers=self._bearer_headers) as resp:
@@ -0,0 +1,218 @@
+"""Lightweight tracing for Pomice's hot paths.
+
+Spans are recorded around track loading, Spotify lookups, track resolution and sending ops,
+so the time it takes for a track to start playing can be broken down by stage.
+Spans nest automatically, including across awaits.
+
+Tracing is a no-op by default. To record spans, set a sink:
+```py
+pomice.tracing.set_sink(pomice.tracing.LoggingSink())
+```
+"""
+
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+__all__ = [
+    "LoggingSink",
+    "NoopSink",
+    "OpenTelemetrySink",
+    "Span",
+    "SpanSink",
+    "current_span",
+    "set_sink",
+    "span",
+    "use_span",
+]
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("pomice_current_span", default=None)
+
+
+class Span:
+    """A timed stage of work, with attributes describing it."""
+
+    __slots__ = ("name", "attributes", "parent", "start", "end", "error", "context")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], parent: Optional["Span"]) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        # Free for sinks to store their own state, such as a span from another library
+        self.context: Any = None
+
+    def __repr__(self) -> str:
+        return f"<Pomice.Span name={self.name!r} duration={self.duration!r}>"
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Returns how long the span took in seconds, or None if it hasn't ended yet."""
+        return None if self.end is None else self.end - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class SpanSink:
+    """The base class for sinks, which receive spans as they start and end."""
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        pass
+
+
+class NoopSink(SpanSink):
+    """Sink which discards every span. This is the default sink."""
+
+
+class LoggingSink(SpanSink):
+    """Sink which logs every span once it ends, along with its duration and attributes."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.DEBUG) -> None:
+        self._logger = logger or logging.getLogger("pomice.tracing")
+        self._level = level
+
+    def on_end(self, span: Span) -> None:
+        depth = 0
+        parent = span.parent
+        while parent:
+            depth += 1
+            parent = parent.parent
+
+        self._logger.log(
+            self._level,
+            "%s%s took %.2fms %s%s",
+            "  " * depth,
+            span.name,
+            span.duration * 1000,
+            span.attributes,
+            f" error={span.error!r}" if span.error else ""
+        )
+
+
+class OpenTelemetrySink(SpanSink):
+    """Sink which mirrors spans to an OpenTelemetry-style tracer.
+       The tracer needs a `start_span(name, context=None, attributes=None)` method
+       returning spans with `set_attribute()`, `record_exception()` and `end()`,
+       such as the tracer returned by `opentelemetry.trace.get_tracer()`.
+    """
+
+    def __init__(self, tracer: Any, *, set_span_in_context: Any = None) -> None:
+        self._tracer = tracer
+        # opentelemetry.trace.set_span_in_context, used to parent spans
+        self._set_span_in_context = set_span_in_context
+
+    def on_start(self, span: Span) -> None:
+        context = None
+        if span.parent and span.parent.context is not None and self._set_span_in_context:
+            context = self._set_span_in_context(span.parent.context)
+
+        span.context = self._tracer.start_span(
+            span.name, context=context, attributes=dict(span.attributes)
+        )
+
+    def on_end(self, span: Span) -> None:
+        external = span.context
+        if external is None:
+            return
+
+        for key, value in span.attributes.items():
+            external.set_attribute(key, value)
+
+        if span.error:
+            external.record_exception(span.error)
+
+        external.end()
+
+
+class _NoopSpanContext:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpanContext":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+class _SpanContext:
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        self._span = Span(name, attributes, _current_span.get())
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        _sink.on_start(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        span = self._span
+        span.end = time.perf_counter()
+        span.error = exc
+
+        _current_span.reset(self._token)
+        _sink.on_end(span)
+
+
+class _UseSpanContext:
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, span: Span) -> None:
+        self._span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, *args) -> None:
+        _current_span.reset(self._token)
+
+
+_NOOP_SPAN = _NoopSpanContext()
+_sink: SpanSink = NoopSink()
+
+
+def set_sink(sink: Optional[SpanSink]) -> None:
+    """Sets the sink spans are sent to. Pass in None to disable tracing."""
+    global _sink
+    _sink = sink or NoopSink()
+
+
+def current_span() -> Optional[Span]:
+    """Returns the span currently being recorded, if any."""
+    return _current_span.get()
+
+
+def span(name: str, **attributes: Any):
+    """Records a span around a block of code, i.e:
+    ```py
+    with pomice.tracing.span("my_bot.play", guild=guild.id):
+        await player.play(track)
+    ```
+    """
+    if isinstance(_sink, NoopSink):
+        return _NOOP_SPAN
+
+    return _SpanContext(name, attributes)
+
+
+def use_span(span: Optional[Span]):
+    """Makes a span the parent of any spans recorded in a block of code,
+       i.e: to carry on a trace in a task other than the one it was started in.
+    """
+    if span is None:
+        return _NOOP_SPAN
+
+    return _UseSpanContext(span)
@@ -1,18 +1,88 @@
+import asyncio
+import hashlib
 import random
+import re
 import time
-import socket
-from typing import Union
+from bisect import bisect, insort
+from typing import Dict, Iterator, List, Optional, Union
 from timeit import default_timer as timer
-from itertools import zip_longest
 
 from discord import AutoShardedClient, Client
 from discord.ext.commands import AutoShardedBot, Bot
 
+from .enums import CircuitState
+from .exceptions import NodeRestException
+
 __all__ = [
+    "CircuitBreaker",
     "ExponentialBackoff",
-    "NodeStats"
+    "HashRing",
+    "LatencyTracker",
+    "NodeStats",
+    "RequestLimiter",
+    "get_voice_region"
 ]
 
+# Voice server endpoints look like "us-east1234.discord.media:443"
+# or "c-ams08-1a2b3c4d.discord.media:443"
+VOICE_REGION_REGEX = re.compile(r"^(?:wss?://)?(?:c-)?(?P<region>[a-z]+(?:-[a-z]+)*?)-?\d")
+
+# Newer endpoints are named after the airport code of the city they're hosted in,
+# so those are mapped back to the region names Discord has always used
+VOICE_REGION_CODES = {
+    "ams": "rotterdam",
+    "rtm": "rotterdam",
+    "fra": "frankfurt",
+    "mad": "madrid",
+    "mxp": "milan",
+    "arn": "stockholm",
+    "hel": "finland",
+    "otp": "bucharest",
+    "svo": "russia",
+    "led": "russia",
+    "tlv": "tel-aviv",
+    "dxb": "dubai",
+    "iad": "us-east",
+    "ewr": "us-east",
+    "atl": "us-south",
+    "dfw": "us-south",
+    "mia": "us-south",
+    "ord": "us-central",
+    "lax": "us-west",
+    "sjc": "us-west",
+    "sea": "us-west",
+    "pdx": "us-west",
+    "yul": "montreal",
+    "gru": "brazil",
+    "scl": "santiago",
+    "eze": "buenos-aires",
+    "hkg": "hongkong",
+    "sin": "singapore",
+    "nrt": "japan",
+    "hnd": "japan",
+    "icn": "south-korea",
+    "bom": "india",
+    "del": "india",
+    "syd": "sydney",
+    "jnb": "southafrica",
+}
+
+
+def get_voice_region(endpoint: Optional[str]) -> Optional[str]:
+    """Returns the voice region of a Discord voice server endpoint, i.e: "us-east" or "rotterdam".
+       Airport codes in newer endpoints, such as "c-ams08-1a2b3c4d", are mapped to their region.
+       Codes without a known region are returned as they are. Returns None if no endpoint is given.
+    """
+    if not endpoint:
+        return None
+
+    endpoint = endpoint.lower()
+    if match := VOICE_REGION_REGEX.match(endpoint):
+        region = match.group("region")
+        return VOICE_REGION_CODES.get(region, region)
+
+    return endpoint.split(".", 1)[0]
+
 
 class ExponentialBackoff:
     """
@@ -84,70 +154,267 @@ class NodeStats:
         self.players_total = data.get("players")
         self.uptime = data.get("uptime")
 
+        # Lavalink omits frame stats when no players are active
+        frames: dict = data.get("frameStats") or {}
+        self.frames_sent = frames.get("sent", 0)
+        self.frames_nulled = frames.get("nulled", 0)
+        self.frames_deficit = frames.get("deficit", 0)
+
+        self.penalty = self._calculate_penalty()
+
+    def _calculate_penalty(self) -> float:
+        # Based off the penalty system used by Lavalink-Client, with extra weight
+        # given to the Lavalink process load, idle players and memory pressure.
+        playing = self.players_active or 0
+        idle = max((self.players_total or 0) - playing, 0)
+        player_penalty = playing + idle * 0.25
+
+        cpu_penalty = 1.05 ** (100 * (self.cpu_system_load or 0)) * 10 - 10
+        process_penalty = 1.05 ** (100 * (self.cpu_process_load or 0)) * 5 - 5
+
+        if self.reservable:
+            memory_usage = min((self.used or 0) / self.reservable, 1)
+        else:
+            memory_usage = 0
+        memory_penalty = 1.05 ** (100 * memory_usage) * 5 - 5
+
+        # Frame stats are per minute, where a healthy player sends 3000 frames
+        deficit_penalty = 1.03 ** (500 * (self.frames_deficit / 3000)) * 600 - 600
+        nulled_penalty = (1.03 ** (500 * (self.frames_nulled / 3000)) * 300 - 300) * 2
+
+        return (
+            player_penalty + cpu_penalty + process_penalty
+            + memory_penalty + deficit_penalty + nulled_penalty
+        )
+
     def __repr__(self) -> str:
-        return f"<Pomice.NodeStats total_players={self.players_total!r} playing_active={self.players_active!r}>"
+        return (
+            f"<Pomice.NodeStats total_players={self.players_total!r} "
+            f"playing_active={self.players_active!r} penalty={self.penalty!r}>"
+        )
 
 
-class Ping:
-    # Thanks to https://github.com/zhengxiaowai/tcping for the nice ping impl
-    def __init__(self, host, port, timeout=5):
-        self.timer = self.Timer()
+class LatencyTracker:
+    """Keeps an exponentially weighted moving average of a node's latency
+       along with a running estimate of its jitter, both in milliseconds.
+    """
 
-        self._successed = 0
-        self._failed = 0
-        self._conn_time = None
-        self._host = host
-        self._port = port
-        self._timeout = timeout
+    def __init__(self, *, alpha: float = 0.25) -> None:
+        self._alpha = alpha
 
-    class Socket(object):
-        def __init__(self, family, type_, timeout):
-            s = socket.socket(family, type_)
-            s.settimeout(timeout)
-            self._s = s
+        self.average: Optional[float] = None
+        self.jitter: float = 0.0
+        self.last: Optional[float] = None
+        self.samples: int = 0
 
-        def connect(self, host, port):
-            self._s.connect((host, int(port)))
+    def update(self, sample: float) -> None:
+        """Feeds a new latency sample (in milliseconds) into the tracker."""
+        self.last = sample
+        self.samples += 1
 
-        def shutdown(self):
-            self._s.shutdown(socket.SHUT_RD)
+        if self.average is None:
+            self.average = sample
+            return
 
-        def close(self):
-            self._s.close()
+        deviation = abs(sample - self.average)
+        self.jitter += self._alpha * (deviation - self.jitter)
+        self.average += self._alpha * (sample - self.average)
 
+    def __repr__(self) -> str:
+        return f"<Pomice.LatencyTracker average={self.average!r} jitter={self.jitter!r}>"
 
-    class Timer(object):
-        def __init__(self):
-            self._start = 0
-            self._stop = 0
 
-        def start(self):
-            self._start = timer()
+class RequestLimiter:
+    """Limits how many requests can be in flight at once.
+       Up to `max_queue` requests can wait for a free slot, after which
+       new requests are rejected with NodeRestException.
+       Also keeps track of how long requests spend waiting for a slot.
+    """
 
-        def stop(self):
-            self._stop = timer()
+    def __init__(self, *, max_concurrency: int = 16, max_queue: int = 256) -> None:
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_queue = max_queue
+
+        self.waiting: int = 0
+        self.rejected: int = 0
+        self.requests: int = 0
+        self.total_wait: float = 0.0
+        self.last_wait: float = 0.0
+
+    @property
+    def average_wait(self) -> float:
+        """Returns the average time in seconds requests spent waiting for a slot."""
+        return self.total_wait / self.requests if self.requests else 0.0
+
+    async def acquire(self) -> float:
+        """Waits for a free slot and returns how long that took in seconds."""
+        if self._semaphore.locked() and self.waiting >= self._max_queue:
+            self.rejected += 1
+            raise NodeRestException("Too many requests are waiting for this node.")
+
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.last_wait = time.monotonic() - start
+        self.total_wait += self.last_wait
+        self.requests += 1
+        return self.last_wait
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    async def __aenter__(self) -> "RequestLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.release()
 
-        def cost(self, funcs, args):
-            self.start()
-            for func, arg in zip_longest(funcs, args):
-                if arg:
-                    func(*arg)
-                else:
-                    func()
+    def __repr__(self) -> str:
+        return (
+            f"<Pomice.RequestLimiter waiting={self.waiting} "
+            f"average_wait={self.average_wait!r} rejected={self.rejected}>"
+        )
+
+
+class CircuitBreaker:
+    """Tracks the health of a node from the results of its health checks and requests.
+       After `failure_threshold` failures in a row the circuit opens.
+       Once `recovery_timeout` seconds have passed it becomes half open, and it closes
+       again after `success_threshold` successes in a row. Any failure while half open
+       opens the circuit again.
+    """
 
-            self.stop()
-            return self._stop - self._start
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30,
+        success_threshold: int = 3
+    ) -> None:
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._success_threshold = success_threshold
+
+        self._state = CircuitState.closed
+        self._failures = 0
+        self._successes = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        """Returns the current state of the circuit."""
+        if (
+            self._state is CircuitState.open
+            and time.monotonic() - self._opened_at >= self._recovery_timeout
+        ):
+            self._state = CircuitState.half_open
+            self._successes = 0
+
+        return self._state
+
+    def record_success(self) -> None:
+        self._failures = 0
+
+        if self.state is CircuitState.half_open:
+            self._successes += 1
+            if self._successes >= self._success_threshold:
+                self._state = CircuitState.closed
+
+    def record_failure(self) -> None:
+        self._failures += 1
+
+        state = self.state
+        if state is CircuitState.half_open or (
+            state is CircuitState.closed and self._failures >= self._failure_threshold
+        ):
+            self._state = CircuitState.open
+            self._opened_at = time.monotonic()
 
-    def _create_socket(self, family, type_):
-        return self.Socket(family, type_, self._timeout)
+    def __repr__(self) -> str:
+        return f"<Pomice.CircuitBreaker state={self.state} failures={self._failures}>"
 
-    def get_ping(self):
-        s = self._create_socket(socket.AF_INET, socket.SOCK_STREAM)
-     
-        cost_time = self.timer.cost(
-            (s.connect, s.shutdown),
-            ((self._host, self._port), None))
-        s_runtime = 1000 * (cost_time)
 
-        return s_runtime
+class HashRing:
+    """A consistent hash ring used to place guilds onto nodes.
+       Each node is placed on the ring `replicas` times, so keys spread evenly,
+       and adding or removing a node only moves roughly 1/N of the keys.
+    """
+
+    def __init__(self, *, replicas: int = 160) -> None:
+        self._replicas = replicas
+        self._hashes: List[int] = []
+        self._owners: Dict[int, str] = {}
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def add(self, identifier: str) -> None:
+        """Adds a node to the ring using its identifier."""
+        for replica in range(self._replicas):
+            point = self._hash(f"{identifier}#{replica}")
+            if point not in self._owners:
+                self._owners[point] = identifier
+                insort(self._hashes, point)
+
+    def remove(self, identifier: str) -> None:
+        """Removes a node from the ring using its identifier."""
+        self._owners = {
+            point: owner for point, owner in self._owners.items() if owner != identifier
+        }
+        self._hashes = sorted(self._owners)
+
+    def iter_nodes(self, key: str) -> Iterator[str]:
+        """Yields the identifiers of every node in the ring, in order of preference for a key."""
+        if not self._hashes:
+            return
+
+        start = bisect(self._hashes, self._hash(key))
+        seen = set()
+        count = len(self._hashes)
+
+        for offset in range(count):
+            identifier = self._owners[self._hashes[(start + offset) % count]]
+            if identifier not in seen:
+                seen.add(identifier)
+                yield identifier
+
+    def __len__(self) -> int:
+        return len(set(self._owners.values()))
+
+    def __repr__(self) -> str:
+        return f"<Pomice.HashRing node_count={len(self)} replicas={self._replicas}>"
+
+
+class Ping:
+    """Measures the time it takes to open a TCP connection to a host.
+       This is done with asyncio streams, so it never blocks the event loop.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 5) -> None:
+        self._host = host
+        self._port = port
+        self._timeout = timeout
 
+    async def get_ping(self) -> float:
+        """Returns the connection time in milliseconds.
+           Raises asyncio.TimeoutError or OSError if the host could not be reached.
+        """
+        start = timer()
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(self._host, int(self._port)), timeout=self._timeout
+        )
+        cost_time = timer() - start
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+        return 1000 * cost_time
@@ -36,7 +36,7 @@ setuptools.setup(
     author="cloudwithax",
     version=version,
     url="https://github.com/cloudwithax/pomice",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=("benchmarks", "benchmarks.*")),
     license="GPL",
     description="The modern Lavalink wrapper designed for Discord.py",
     long_description=readme,